@@ -4,27 +4,37 @@ Local RAG Chatbot - Main Streamlit Application
 Simple chatbot for document Q&A using local resources
 """
 
+import asyncio
+import functools
+import html
+import os
+import re
+import threading
+import numpy as np
 import streamlit as st
+from urllib.parse import urlparse
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from modules.document_processor import (
     validate_document_requirements,
-    extract_text_from_document,
-    hybrid_chunking
+    extract_text_from_document
 )
 from modules.web_scraper import (
     validate_url,
-    scrape_url_to_pages
+    scrape_url_to_pages,
+    get_http_session
 )
 from modules.embeddings_local import (
-    generate_embeddings_for_chunk,
-    generate_embeddings_for_query
+    generate_embeddings_batch
 )
 from modules.database_local import (
-    store_document_chunks,
+    get_or_create_collection,
     search_similar_chunks,
     get_all_documents,
     delete_document
 )
-from modules.llm_local import generate_rag_response, test_ollama_connection
+from modules.llm_local import generate_rag_response_stream, clean_answer, test_ollama_connection
+from modules.query_cache import get_query_cache
+from modules.pipeline import run_ingestion_pipeline
 
 # Page configuration
 st.set_page_config(
@@ -33,187 +43,234 @@ st.set_page_config(
     layout="wide"
 )
 
-# Custom CSS
-st.markdown("""
-    <style>
-    /* Main Header */
-    .main-header {
-        font-size: 2.5rem;
-        font-weight: bold;
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        background-clip: text;
-        margin-bottom: 1rem;
-    }
-    
-    /* Sub Header */
-    .sub-header {
-        font-size: 1.5rem;
-        font-weight: bold;
-        color: #2c3e50;
-        margin-top: 1.5rem;
-        margin-bottom: 1rem;
-    }
-    
-    /* Chat Message Styling */
-    .stChatMessage {
-        padding: 1rem;
-        border-radius: 12px;
-        margin-bottom: 1rem;
-    }
-    
-    /* User Message */
-    [data-testid="stChatMessage"] [data-testid="stChatMessageUser"] {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        padding: 1rem 1.5rem;
-        border-radius: 18px 18px 4px 18px;
-        margin-left: auto;
-        max-width: 85%;
-        box-shadow: 0 2px 8px rgba(102, 126, 234, 0.3);
-    }
-    
-    /* Assistant Message */
-    [data-testid="stChatMessage"] [data-testid="stChatMessageAssistant"] {
-        background: #f0f2f6;
-        color: #1f2937;
-        padding: 1rem 1.5rem;
-        border-radius: 18px 18px 18px 4px;
-        margin-right: auto;
-        max-width: 85%;
-        box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-        border-left: 4px solid #667eea;
-    }
-    
-    /* Chat Input */
-    .stChatInputContainer {
-        position: sticky;
-        bottom: 0;
-        background: white;
-        padding: 1rem 0;
-        border-top: 1px solid #e5e7eb;
-        z-index: 100;
-    }
-    
-    /* Sidebar Styling */
-    .css-1d391kg {
-        background: linear-gradient(180deg, #f8f9fa 0%, #ffffff 100%);
-    }
-    
-    /* Info/Warning Boxes */
-    .stInfo {
-        background: #e0f2fe;
-        border-left: 4px solid #0ea5e9;
-        border-radius: 8px;
-        padding: 1rem;
-    }
-    
-    .stWarning {
-        background: #fef3c7;
-        border-left: 4px solid #f59e0b;
-        border-radius: 8px;
-        padding: 1rem;
-    }
-    
-    .stSuccess {
-        background: #d1fae5;
-        border-left: 4px solid #10b981;
-        border-radius: 8px;
-        padding: 1rem;
-    }
-    
-    /* Button Styling */
-    .stButton > button {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        border: none;
-        border-radius: 8px;
-        padding: 0.5rem 1.5rem;
-        font-weight: 600;
-        transition: all 0.3s ease;
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 4px 12px rgba(102, 126, 234, 0.4);
-    }
-    
-    /* Code Blocks */
-    pre {
-        background: #1e293b;
-        color: #e2e8f0;
-        border-radius: 8px;
-        padding: 1rem;
-        overflow-x: auto;
-    }
-    
-    /* Scrollbar Styling */
-    ::-webkit-scrollbar {
-        width: 8px;
-        height: 8px;
-    }
-    
-    ::-webkit-scrollbar-track {
-        background: #f1f1f1;
-        border-radius: 10px;
-    }
-    
-    ::-webkit-scrollbar-thumb {
-        background: #667eea;
-        border-radius: 10px;
-    }
-    
-    ::-webkit-scrollbar-thumb:hover {
-        background: #764ba2;
-    }
+# Custom CSS (kept in static/app.css)
+CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "app.css")
+
+@st.cache_data(show_spinner=False)
+def _load_css():
+    """Read the stylesheet once per process"""
+    with open(CSS_PATH, encoding="utf-8") as f:
+        return f.read()
+
+st.markdown(f"<style>{_load_css()}</style>", unsafe_allow_html=True)
+
+# Prompt classification: category -> trigger phrases (substrings of the lowercased prompt)
+PROMPT_CATEGORY_TRIGGERS = {
+    'navigation': ("where", "how to access", "navigate", "go to", "find"),
+    'db_user': (
+        "create user", "create schema", "database user", "privileged user",
+        "minimally privileged", "schema creation", "database schema",
+        "sql user", "grant privileges", "create database user"
+    ),
+    'connection': (
+        "connect to", "database connection", "database server",
+        "how to connect", "database access", "sql connection"
+    ),
+    'about': ("what is this", "what is the", "what does this", "what is it about", "about this", "tell me about"),
+    'general': (
+        "what is this", "what is the", "what does this",
+        "what is it about", "about this", "tell me about",
+        "what is", "describe this", "explain this"
+    ),
+    'explain': ("what", "explain", "describe", "tell me about"),
+    'steps': ("how", "steps", "process", "procedure"),
+    'aidp': ("aidp", "ai data platform", "oracle ai data platform"),
+    'apex': ("apex", "application express", "oracle apex"),
+    'feedback': (
+        'not complete', 'incomplete', 'wrong', 'incorrect', 'not right',
+        'doesn\'t work', 'not working', 'error', 'fix', 'help', 'answer is not'
+    ),
+}
+
+# Words that mark a question when the prompt starts with them
+QUESTION_WORDS = ('what', 'how', 'where', 'when', 'why', 'who', 'which', 'explain', 'describe', 'tell me', 'show me')
+
+# Prompts shorter than this are rejected before any embedding or search
+MIN_PROMPT_LENGTH = 5
+# Canned replies for prompts that are nothing but small talk (compared after
+# lowercasing and dropping punctuation); anything longer goes to retrieval
+GREETING_REPLY = "👋 Hello! Ask me anything about your uploaded documents."
+THANKS_REPLY = "😊 You're welcome! Ask another question whenever you like."
+FAREWELL_REPLY = "👋 Goodbye! Your documents will be here when you come back."
+SMALL_TALK_REPLIES = {
+    **dict.fromkeys((
+        "hi", "hello", "hey", "hi there", "hello there", "hey there",
+        "good morning", "good afternoon", "good evening"
+    ), GREETING_REPLY),
+    **dict.fromkeys((
+        "thanks", "thank you", "thanks a lot", "thank you so much", "many thanks",
+        "thanks so much", "ok thanks", "ok thank you"
+    ), THANKS_REPLY),
+    **dict.fromkeys(("bye", "goodbye", "bye bye", "see you", "thanks bye"), FAREWELL_REPLY),
+}
+SMALL_TALK_PUNCTUATION = re.compile(r'[^\w\s]')
+
+# Common words skipped when picking context terms from earlier questions
+CONTEXT_STOP_WORDS = frozenset({'what', 'how', 'when', 'where', 'which', 'about', 'will', 'does', 'this', 'that', 'the', 'and', 'for', 'with'})
+# Common words skipped when picking topic keywords from the current question
+TOPIC_STOP_WORDS = frozenset({'what', 'how', 'when', 'where', 'which', 'who', 'why', 'will', 'does', 'is', 'are', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'about', 'this', 'that', 'these', 'those'})
+ACRONYM_PATTERN = re.compile(r'\b[A-Z]{2,}\b')
+WORD_PATTERN = re.compile(r'\b\w+\b')
+# Acronym-filtered searches returning fewer chunks than this are retried unfiltered
+MIN_FILTERED_RESULTS = 5
+# Characters in a URL path replaced with '_' when naming scraped documents
+URL_PATH_PATTERN = re.compile(r'[/.]')
+
+@functools.lru_cache(maxsize=256)
+def topic_keyword_pattern(prompt):
+    """
+    Compile the topic keywords of a question into one pattern (memoized per prompt)
     
-    /* Document List Styling */
-    .document-item {
-        background: white;
-        padding: 1rem;
-        border-radius: 8px;
-        margin-bottom: 0.5rem;
-        box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1);
-        transition: all 0.3s ease;
-    }
+    Args:
+        prompt: The user's question as typed
     
-    .document-item:hover {
-        box-shadow: 0 4px 12px rgba(0, 0, 0, 0.15);
-        transform: translateY(-2px);
-    }
+    Returns:
+        Compiled alternation matching any keyword in lowercased text, or None if
+        the question has no keywords
+    """
+    # Key terms from the question (excluding common words)
+    question_keywords = {w for w in WORD_PATTERN.findall(prompt.lower()) if len(w) > 3 and w not in TOPIC_STOP_WORDS}
     
-    /* Spinner Styling */
-    .stSpinner > div {
-        border-color: #667eea transparent #667eea transparent;
-    }
+    # Acronyms (like AIDP, APEX, OCI, etc.)
+    question_keywords.update(a.lower() for a in ACRONYM_PATTERN.findall(prompt))
     
-    /* Expander Styling */
-    .streamlit-expanderHeader {
-        background: #f8f9fa;
-        border-radius: 8px;
-        font-weight: 600;
-    }
+    if not question_keywords:
+        return None
     
-    /* Main Container */
-    .main .block-container {
-        padding-top: 2rem;
-        padding-bottom: 2rem;
+    # One alternation finds any keyword in a single C-level pass per chunk
+    return re.compile('|'.join(map(re.escape, sorted(question_keywords, key=len, reverse=True))))
+
+def _message_keywords(message):
+    """
+    Key terms a chat message adds to later queries
+    
+    Computed on first use and stored on the message in session state, so
+    each message is tokenized once rather than on every new question.
+    """
+    if "_keywords" not in message:
+        if message["role"] == "user":
+            # Important words from questions, skipping common ones
+            words = message["content"].lower().split()
+            message["_keywords"] = [w for w in words if len(w) > 4 and w not in CONTEXT_STOP_WORDS]
+        elif message["role"] == "assistant":
+            # Acronyms from the start of answers (first 200 chars)
+            message["_keywords"] = [a.lower() for a in ACRONYM_PATTERN.findall(message["content"][:200])]
+        else:
+            message["_keywords"] = []
+    return message["_keywords"]
+
+def _build_prompt_classifier():
+    """Compile all trigger phrases into one pattern scanned in a single pass"""
+    phrases = sorted({p for triggers in PROMPT_CATEGORY_TRIGGERS.values() for p in triggers}, key=len, reverse=True)
+    # At each position the longest phrase wins; every shorter trigger found there is a
+    # substring of it, so each phrase maps to all categories of triggers it contains
+    phrase_categories = {
+        phrase: frozenset(
+            category for category, triggers in PROMPT_CATEGORY_TRIGGERS.items()
+            if any(trigger in phrase for trigger in triggers)
+        )
+        for phrase in phrases
     }
-    
-    /* Hide Streamlit Branding */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    </style>
-""", unsafe_allow_html=True)
+    pattern = re.compile('(?=(' + '|'.join(map(re.escape, phrases)) + '))')
+    return pattern, phrase_categories
+
+_PROMPT_PATTERN, _PHRASE_CATEGORIES = _build_prompt_classifier()
+_QUESTION_START_RE = re.compile('|'.join(map(re.escape, QUESTION_WORDS)))
+
+@functools.lru_cache(maxsize=512)
+def classify_prompt(prompt_lower):
+    """Return the set of categories matched by a lowercased prompt (memoized)"""
+    categories = set()
+    for match in _PROMPT_PATTERN.finditer(prompt_lower):
+        categories |= _PHRASE_CATEGORIES[match.group(1)]
+    if _QUESTION_START_RE.match(prompt_lower):
+        categories.add('question')
+    return frozenset(categories)
+
+# Query expansion hints per prompt category, in the order they are appended
+QUERY_HINTS = {
+    'navigation': (
+        "menu navigation", "how to access", "where to find",
+        "location in menu", "screen navigation", "menu path",
+        "access path", "where to navigate"
+    ),
+    # Database/user creation specific expansion
+    'db_user': (
+        "database schema", "SQL create user", "grant privileges",
+        "database user creation", "SQL commands", "SYSDBA",
+        "create user identified by", "default tablespace",
+        "grant create view", "connect to database", "SQL*Plus", "database server"
+    ),
+    # Connection/database access specific expansion
+    'connection': (
+        "SQL*Plus", "database connection", "connect as SYS",
+        "SYSDBA role", "connection string", "database server", "SQL connection"
+    ),
+    # General "about" questions - add overview/summary keywords
+    'about': (
+        "overview", "summary", "introduction", "executive summary",
+        "document purpose", "what is", "description", "about",
+        "white paper", "document content", "main topic", "subject"
+    ),
+    'explain': ("information details explanation",),
+    'steps': ("steps procedure process method",),
+    # AIDP/AI Data Platform specific expansion
+    'aidp': (
+        "AI Data Platform", "AIDP", "Oracle AI Data Platform",
+        "AI Data Platform Workbench", "AIDP Units", "OCPU", "memory",
+        "compute cluster", "pricing", "cost", "help", "benefits", "features"
+    ),
+    # APEX specific expansion (to differentiate from AIDP)
+    'apex': (
+        "Oracle APEX", "Application Express", "APEX",
+        "workspace", "application builder", "page designer"
+    ),
+}
+
+@functools.lru_cache(maxsize=64)
+def category_hints(categories):
+    """Deduplicated hint phrases for a set of prompt categories, in QUERY_HINTS order"""
+    # Categories share some hints (e.g. "SQL*Plus"), so keep each phrase once
+    hints = {}
+    for category, phrases in QUERY_HINTS.items():
+        if category in categories:
+            hints.update(dict.fromkeys(phrases))
+    return tuple(hints)
+
+@st.cache_resource(ttl=30, show_spinner=False)
+def _ollama_alive():
+    """Check Ollama at most every 30 seconds instead of on every rerun"""
+    return test_ollama_connection()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_get_all_documents():
+    """Document list shared across reruns (cleared when documents change)"""
+    return get_all_documents()
+
+async def _embed_queries_and_warm_index(query_texts):
+    """Encode the queries while the vector collection is opened on another thread"""
+    ctx = get_script_run_ctx()
+    
+    def run_with_ctx(fn, *args):
+        # Let st.* calls inside the helpers reach the current page
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+    
+    query_embeddings, _ = await asyncio.gather(
+        asyncio.to_thread(run_with_ctx, generate_embeddings_batch, query_texts),
+        asyncio.to_thread(run_with_ctx, get_or_create_collection)
+    )
+    return query_embeddings
+
+# Upper bound on URLs scraped at once
+MAX_CONCURRENT_FETCHES = 8
 
 def main():
     """Main application"""
     st.markdown('<h1 class="main-header">🤖 Local RAG Chatbot</h1>', unsafe_allow_html=True)
     
     # Check Ollama connection
-    if not test_ollama_connection():
+    if not _ollama_alive():
         st.error("⚠️ Ollama is not running! Please start Ollama first.")
         st.info("To start Ollama, open a new terminal and run: `ollama serve`")
         st.stop()
@@ -226,6 +283,19 @@ def main():
         label_visibility="collapsed"
     )
     
+    # Sidebar settings
+    st.sidebar.markdown("---")
+    st.sidebar.markdown("### ⚙️ Settings")
+    cpu_count = os.cpu_count() or 4
+    st.sidebar.slider(
+        "Chunking threads",
+        min_value=1,
+        max_value=cpu_count * 2,
+        value=cpu_count,
+        key="chunking_workers",
+        help="Number of threads used to split document pages into chunks."
+    )
+    
     # Sidebar info
     st.sidebar.markdown("---")
     st.sidebar.markdown("### ℹ️ About")
@@ -289,9 +359,11 @@ def upload_page():
                 valid_urls = []
                 invalid_urls = []
                 
+                # Format checks only; reachability is reported by the scrape itself
+                validation_results = [validate_url(url) for url in urls]
+                
                 with st.expander(f"🔍 Validate {len(urls)} URL(s)", expanded=False):
-                    for idx, url in enumerate(urls, 1):
-                        is_valid, message = validate_url(url)
+                    for idx, (url, (is_valid, message)) in enumerate(zip(urls, validation_results), 1):
                         if is_valid:
                             st.success(f"✅ URL {idx}: {url}")
                             valid_urls.append(url)
@@ -320,26 +392,45 @@ def upload_page():
     st.markdown("---")
     st.markdown('<h3 class="sub-header">📚 Your Documents</h3>', unsafe_allow_html=True)
     
-    documents = get_all_documents()
+    documents = _cached_get_all_documents()
     if documents:
         st.caption(f"Total: {len(documents)} document(s) in your knowledge base")
-        for doc_name in documents:
-            with st.container():
-                col1, col2 = st.columns([4, 1])
-                with col1:
-                    st.markdown(f"""
-                    <div class="document-item">
-                        <strong>📄 {doc_name}</strong>
-                    </div>
-                    """, unsafe_allow_html=True)
-                with col2:
-                    if st.button("🗑️ Delete", key=f"delete_{doc_name}", use_container_width=True):
-                        if delete_document(doc_name):
-                            st.success(f"✅ Deleted **{doc_name}**")
-                            st.rerun()
+        
+        # Render the whole list as one element instead of a row of widgets per document
+        st.markdown("\n".join(
+            f'<div class="document-item"><strong>📄 {html.escape(doc_name)}</strong></div>'
+            for doc_name in documents
+        ), unsafe_allow_html=True)
+        
+        # A single delete control for all documents
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            doc_to_delete = st.selectbox("Select a document to delete", documents, key="doc_to_delete")
+        with col2:
+            st.write("")  # Align the button with the select box
+            if st.button("🗑️ Delete", key="delete_document", use_container_width=True):
+                if delete_document(doc_to_delete):
+                    _cached_get_all_documents.clear()
+                    get_query_cache().clear()
+                    st.success(f"✅ Deleted **{doc_to_delete}**")
+                    st.rerun()
     else:
         st.info("📭 **No documents uploaded yet.** Upload your first document above to get started!")
 
+def load_uploaded_file(uploaded_file):
+    """Validate and extract an uploaded file for the ingestion pipeline"""
+    is_valid, message = validate_document_requirements(uploaded_file)
+    if not is_valid:
+        return None, None, message
+    
+    # Pages are extracted lazily as the pipeline consumes them
+    pages = extract_text_from_document(uploaded_file)
+    if pages is None:
+        return None, None, "Failed to extract text"
+    
+    doc_name = uploaded_file.name.rsplit('.', 1)[0]  # Remove extension
+    return pages, doc_name, None
+
 def process_documents(uploaded_files):
     """Process uploaded documents with improved error handling and feedback"""
     if not uploaded_files:
@@ -352,110 +443,61 @@ def process_documents(uploaded_files):
     with status_container:
         progress_bar = st.progress(0)
         status_text = st.empty()
+        embedding_progress = st.empty()
         file_status = {}  # Track status of each file
     
     successful_files = 0
     failed_files = 0
     
-    for idx, uploaded_file in enumerate(uploaded_files):
-        file_key = f"{uploaded_file.name}_{idx}"
-        status_text.text(f"📄 Processing {idx + 1}/{len(uploaded_files)}: {uploaded_file.name}...")
-        progress_bar.progress((idx) / len(uploaded_files))
+    def handle_event(event):
+        """Render pipeline progress and results (runs on the script thread)"""
+        nonlocal successful_files, failed_files
+        name = event['name']
+        file_key = f"{name}_{event['index']}"
         
-        try:
-            # Step 1: Validate
-            status_text.text(f"🔍 Validating {uploaded_file.name}...")
-            is_valid, message = validate_document_requirements(uploaded_file)
-            if not is_valid:
-                st.error(f"❌ **{uploaded_file.name}**: {message}")
-                file_status[file_key] = {"status": "failed", "message": message}
-                failed_files += 1
-                continue
-            
-            # Step 2: Extract text
-            status_text.text(f"📖 Extracting text from {uploaded_file.name}...")
-            pages_data = extract_text_from_document(uploaded_file)
-            if not pages_data:
-                st.error(f"❌ **{uploaded_file.name}**: Failed to extract text")
-                file_status[file_key] = {"status": "failed", "message": "Text extraction failed"}
-                failed_files += 1
-                continue
-            
-            st.info(f"📄 Extracted {len(pages_data)} page(s) from {uploaded_file.name}")
-            
-            # Step 3: Create chunks
-            status_text.text(f"✂️ Creating chunks for {uploaded_file.name}...")
-            all_chunks = []
-            global_chunk_index = 0
-            for page_data in pages_data:
-                chunks = hybrid_chunking(page_data['text'])
-                for chunk_text in chunks:
-                    all_chunks.append({
-                        'chunk_text': chunk_text,
-                        'chunk_index': global_chunk_index,
-                        'page_number': page_data['page_number']
-                    })
-                    global_chunk_index += 1
-            
-            if not all_chunks:
-                st.warning(f"⚠️ **{uploaded_file.name}**: No chunks created. File may be too short.")
-                file_status[file_key] = {"status": "failed", "message": "No chunks created"}
-                failed_files += 1
-                continue
-            
-            st.info(f"📝 Created {len(all_chunks)} chunk(s) from {uploaded_file.name}")
-            
-            # Step 4: Generate embeddings
-            status_text.text(f"🧮 Generating embeddings for {uploaded_file.name}...")
-            chunks_with_embeddings = []
-            total_chunks = len(all_chunks)
-            
-            # Show progress for embeddings with better feedback
-            embedding_progress = st.progress(0)
-            embedding_status = st.empty()
-            for i, chunk in enumerate(all_chunks):
-                embedding_status.text(f"Generating embedding {i + 1}/{total_chunks}...")
-                embedding = generate_embeddings_for_chunk(chunk['chunk_text'])
-                if embedding:
-                    chunks_with_embeddings.append({
-                        **chunk,
-                        'embeddings': embedding
-                    })
-                embedding_progress.progress((i + 1) / total_chunks)
-            
+        if event['type'] == 'extracting':
+            status_text.text(f"📖 Extracting text from {name}...")
+        elif event['type'] == 'extracted':
+            st.info(f"📄 Extracted {event['pages']} page(s) from {name}")
+        elif event['type'] == 'chunking':
+            status_text.text(f"✂️ Creating chunks for {name}...")
+        elif event['type'] == 'chunked':
+            st.info(f"📝 Created {event['chunks']} chunk(s) from {name}")
+        elif event['type'] == 'embedding':
+            status_text.text(f"🧮 Generating embeddings for {name}...")
+        elif event['type'] == 'embed_progress':
+            # Chunks stream in while the document is still being read, so there is no total yet
+            embedding_progress.text(f"🧮 Embedded {event['done']} chunk(s) of {name}...")
+        elif event['type'] == 'storing':
+            status_text.text(f"💾 Storing {name} in database...")
+        elif event['type'] == 'result':
             embedding_progress.empty()
-            embedding_status.empty()
-            
-            if not chunks_with_embeddings:
-                st.error(f"❌ **{uploaded_file.name}**: Failed to generate embeddings")
-                file_status[file_key] = {"status": "failed", "message": "Embedding generation failed"}
-                failed_files += 1
-                continue
-            
-            # Step 5: Store in database
-            status_text.text(f"💾 Storing {uploaded_file.name} in database...")
-            doc_name = uploaded_file.name.rsplit('.', 1)[0]  # Remove extension
-            
-            if store_document_chunks(doc_name, chunks_with_embeddings):
-                st.success(f"✅ **{uploaded_file.name}**: Successfully processed ({len(chunks_with_embeddings)} chunks)")
-                file_status[file_key] = {"status": "success", "chunks": len(chunks_with_embeddings)}
+            if event['status'] == 'success':
+                get_query_cache().clear()
+                _cached_get_all_documents.clear()
+                st.success(f"✅ **{name}**: Successfully processed ({event['chunks']} chunks)")
+                file_status[file_key] = {"status": "success", "chunks": event['chunks']}
                 successful_files += 1
             else:
-                st.error(f"❌ **{uploaded_file.name}**: Failed to store in database")
-                file_status[file_key] = {"status": "failed", "message": "Database storage failed"}
+                st.error(f"❌ **{name}**: {event['message']}")
+                if event.get('details'):
+                    with st.expander(f"Error Details for {name}"):
+                        st.code(event['details'])
+                file_status[file_key] = {"status": "failed", "message": event['message']}
                 failed_files += 1
-            
-            progress_bar.progress((idx + 1) / len(uploaded_files))
-            
-        except Exception as e:
-            st.error(f"❌ **{uploaded_file.name}**: Error - {str(e)}")
-            with st.expander(f"Error Details for {uploaded_file.name}"):
-                import traceback
-                st.code(traceback.format_exc())
-            file_status[file_key] = {"status": "failed", "message": str(e)}
-            failed_files += 1
+            progress_bar.progress((successful_files + failed_files) / len(uploaded_files))
+    
+    # Extraction of later files overlaps with embedding and storage of earlier ones
+    run_ingestion_pipeline(
+        [{'name': uploaded_file.name, 'source': uploaded_file} for uploaded_file in uploaded_files],
+        load_uploaded_file,
+        on_event=handle_event,
+        chunk_workers=st.session_state.get("chunking_workers")
+    )
     
     # Final summary
+    _cached_get_all_documents.clear()
+    embedding_progress.empty()
     status_text.text("✅ Processing complete!")
     progress_bar.progress(1.0)
     
@@ -472,6 +514,20 @@ def process_documents(uploaded_files):
     # Keep progress indicators visible for user to see final status
     # They will be cleared when user interacts with the app
 
+def load_url(url):
+    """Scrape a URL for the ingestion pipeline"""
+    pages_data, error = scrape_url_to_pages(url)
+    if not pages_data:
+        return None, None, f"Failed to scrape content: {error}" if error else "Failed to scrape content"
+    
+    # Create a clean document name from URL
+    parsed_url = urlparse(url)
+    doc_name = f"{parsed_url.netloc.replace('www.', '')}_{URL_PATH_PATTERN.sub('_', parsed_url.path)[:50]}"
+    if not doc_name or doc_name == '_':
+        doc_name = f"webpage_{url[:50].replace('://', '_').replace('/', '_')}"
+    
+    return pages_data, doc_name, None
+
 def process_urls(urls):
     """Process multiple URLs by scraping and adding to knowledge base"""
     if not urls:
@@ -484,107 +540,64 @@ def process_urls(urls):
     with status_container:
         progress_bar = st.progress(0)
         status_text = st.empty()
+        embedding_progress = st.empty()
         url_status = {}  # Track status of each URL
     
     successful_urls = 0
     failed_urls = 0
     
-    for idx, url in enumerate(urls):
-        url_key = f"{url}_{idx}"
-        status_text.text(f"🌐 Processing {idx + 1}/{len(urls)}: {url[:60]}...")
-        progress_bar.progress((idx) / len(urls))
+    def handle_event(event):
+        """Render pipeline progress and results (runs on the script thread)"""
+        nonlocal successful_urls, failed_urls
+        name = event['name']
+        url_key = f"{name}_{event['index']}"
         
-        try:
-            # Step 1: Scrape content (validation already done)
-            status_text.text(f"📥 Scraping content from {url[:60]}...")
-            pages_data = scrape_url_to_pages(url)
-            if not pages_data:
-                st.error(f"❌ **{url[:60]}...**: Failed to scrape content")
-                url_status[url_key] = {"status": "failed", "message": "Scraping failed"}
-                failed_urls += 1
-                continue
-            
-            st.info(f"📄 Scraped {len(pages_data)} section(s) from {url[:60]}...")
-            
-            # Step 2: Create chunks
-            status_text.text(f"✂️ Creating chunks from {url[:60]}...")
-            all_chunks = []
-            global_chunk_index = 0
-            for page_data in pages_data:
-                chunks = hybrid_chunking(page_data['text'])
-                for chunk_text in chunks:
-                    all_chunks.append({
-                        'chunk_text': chunk_text,
-                        'chunk_index': global_chunk_index,
-                        'page_number': page_data['page_number']
-                    })
-                    global_chunk_index += 1
-            
-            if not all_chunks:
-                st.warning(f"⚠️ **{url[:60]}...**: No chunks created. Page may be too short.")
-                url_status[url_key] = {"status": "failed", "message": "No chunks created"}
-                failed_urls += 1
-                continue
-            
-            st.info(f"📝 Created {len(all_chunks)} chunk(s) from {url[:60]}...")
-            
-            # Step 3: Generate embeddings
-            status_text.text(f"🧮 Generating embeddings for {url[:60]}...")
-            chunks_with_embeddings = []
-            total_chunks = len(all_chunks)
-            
-            # Show progress for embeddings
-            embedding_progress = st.progress(0)
-            embedding_status = st.empty()
-            for i, chunk in enumerate(all_chunks):
-                embedding_status.text(f"Generating embedding {i + 1}/{total_chunks}...")
-                embedding = generate_embeddings_for_chunk(chunk['chunk_text'])
-                if embedding:
-                    chunks_with_embeddings.append({
-                        **chunk,
-                        'embeddings': embedding
-                    })
-                embedding_progress.progress((i + 1) / total_chunks)
-            
+        if event['type'] == 'extracting':
+            status_text.text(f"📥 Scraping content from {name}...")
+        elif event['type'] == 'extracted':
+            st.info(f"📄 Scraped {event['pages']} section(s) from {name}...")
+        elif event['type'] == 'chunking':
+            status_text.text(f"✂️ Creating chunks from {name}...")
+        elif event['type'] == 'chunked':
+            st.info(f"📝 Created {event['chunks']} chunk(s) from {name}...")
+        elif event['type'] == 'embedding':
+            status_text.text(f"🧮 Generating embeddings for {name}...")
+        elif event['type'] == 'embed_progress':
+            embedding_progress.text(f"🧮 Embedded {event['done']} chunk(s) of {name}...")
+        elif event['type'] == 'storing':
+            status_text.text(f"💾 Storing {name}... in database...")
+        elif event['type'] == 'result':
             embedding_progress.empty()
-            embedding_status.empty()
-            
-            if not chunks_with_embeddings:
-                st.error(f"❌ **{url[:60]}...**: Failed to generate embeddings")
-                url_status[url_key] = {"status": "failed", "message": "Embedding generation failed"}
-                failed_urls += 1
-                continue
-            
-            # Step 4: Store in database
-            status_text.text(f"💾 Storing {url[:60]}... in database...")
-            
-            # Create a clean document name from URL
-            from urllib.parse import urlparse
-            parsed_url = urlparse(url)
-            doc_name = f"{parsed_url.netloc.replace('www.', '')}_{parsed_url.path.replace('/', '_').replace('.', '_')[:50]}"
-            if not doc_name or doc_name == '_':
-                doc_name = f"webpage_{url[:50].replace('://', '_').replace('/', '_')}"
-            
-            if store_document_chunks(doc_name, chunks_with_embeddings):
-                st.success(f"✅ **{url[:60]}...**: Successfully processed ({len(chunks_with_embeddings)} chunks)")
-                url_status[url_key] = {"status": "success", "chunks": len(chunks_with_embeddings)}
+            if event['status'] == 'success':
+                get_query_cache().clear()
+                _cached_get_all_documents.clear()
+                st.success(f"✅ **{name}...**: Successfully processed ({event['chunks']} chunks)")
+                url_status[url_key] = {"status": "success", "chunks": event['chunks']}
                 successful_urls += 1
             else:
-                st.error(f"❌ **{url[:60]}...**: Failed to store in database")
-                url_status[url_key] = {"status": "failed", "message": "Database storage failed"}
+                st.error(f"❌ **{name}...**: {event['message']}")
+                if event.get('details'):
+                    with st.expander(f"Error Details for {name}..."):
+                        st.code(event['details'])
+                url_status[url_key] = {"status": "failed", "message": event['message']}
                 failed_urls += 1
-            
-            progress_bar.progress((idx + 1) / len(urls))
-            
-        except Exception as e:
-            st.error(f"❌ **{url[:60]}...**: Error - {str(e)}")
-            with st.expander(f"Error Details for {url[:60]}..."):
-                import traceback
-                st.code(traceback.format_exc())
-            url_status[url_key] = {"status": "failed", "message": str(e)}
-            failed_urls += 1
+            progress_bar.progress((successful_urls + failed_urls) / len(urls))
+    
+    # Scraping of later URLs overlaps with embedding and storage of earlier ones.
+    # Open the HTTP session here; the fetch threads have no script run context
+    get_http_session()
+    run_ingestion_pipeline(
+        [{'name': url[:60], 'source': url} for url in urls],
+        load_url,
+        on_event=handle_event,
+        chunk_workers=st.session_state.get("chunking_workers"),
+        # Scraping waits on the network, so fetch several pages at once
+        extract_workers=min(len(urls), MAX_CONCURRENT_FETCHES)
+    )
     
     # Final summary
+    _cached_get_all_documents.clear()
+    embedding_progress.empty()
     status_text.text("✅ Processing complete!")
     progress_bar.progress(1.0)
     
@@ -609,7 +622,7 @@ def chat_page():
     st.markdown('<h2 class="sub-header">💬 Chat Interface</h2>', unsafe_allow_html=True)
     
     # Check if documents exist
-    documents = get_all_documents()
+    documents = _cached_get_all_documents()
     if not documents:
         st.warning("⚠️ **No documents uploaded yet.** Please upload documents first to start chatting.")
         st.info("💡 Go to the **Upload Documents** page in the sidebar to add your documents.")
@@ -645,18 +658,33 @@ def chat_page():
     # Chat input with better placeholder
     if prompt := st.chat_input("💬 Ask a question about your documents..."):
         # Validate the query
+        # Lowercase and tokenize once; every check below reuses these
         prompt_lower = prompt.lower().strip()
+        prompt_words = prompt_lower.split()
+        categories = classify_prompt(prompt_lower)
         
         # Check if it's a valid question
-        question_words = ['what', 'how', 'where', 'when', 'why', 'who', 'which', 'explain', 'describe', 'tell me', 'show me']
-        is_question = any(prompt_lower.startswith(word) for word in question_words) or '?' in prompt
+        is_question = 'question' in categories or '?' in prompt
         
         # Check for feedback/comments (not questions)
-        feedback_phrases = [
-            'not complete', 'incomplete', 'wrong', 'incorrect', 'not right', 
-            'doesn\'t work', 'not working', 'error', 'fix', 'help', 'answer is not'
-        ]
-        is_feedback = any(phrase in prompt_lower for phrase in feedback_phrases) and not is_question
+        is_feedback = 'feedback' in categories and not is_question
+        
+        # Greetings, thanks and goodbyes get a canned reply without touching the
+        # embedder, but only when they are the whole prompt ("hi, list AIDP steps" is a query)
+        small_talk_reply = SMALL_TALK_REPLIES.get(' '.join(SMALL_TALK_PUNCTUATION.sub(' ', prompt_lower).split()))
+        
+        if small_talk_reply:
+            st.session_state.messages.append({"role": "user", "content": prompt})
+            st.session_state.messages.append({"role": "assistant", "content": small_talk_reply})
+            with st.chat_message("user"):
+                st.markdown(prompt)
+            with st.chat_message("assistant"):
+                st.markdown(small_talk_reply)
+            return
+        
+        if len(prompt_lower) < MIN_PROMPT_LENGTH:
+            st.warning("⚠️ Your message is too short to search for. Please ask a complete question.")
+            return
         
         if is_feedback:
             st.warning("⚠️ It looks like you're providing feedback rather than asking a question.")
@@ -677,150 +705,78 @@ def chat_page():
             with st.spinner("Thinking..."):
                 # Query expansion for better retrieval with context awareness
                 expanded_query = prompt
-                query_hints = []
+                query_hints = {}  # Ordered set: dict keys keep insertion order and drop repeats
                 
                 # Extract context from previous messages (last 2-3 messages)
-                context_keywords = []
+                context_keywords = {}
+                context_terms = ()
                 if len(st.session_state.messages) > 0:
                     # Get recent messages for context
                     recent_messages = st.session_state.messages[-4:]  # Last 4 messages (2 Q&A pairs)
                     for msg in recent_messages:
-                        if msg["role"] == "user":
-                            # Extract key terms from previous questions
-                            words = msg["content"].lower().split()
-                            # Filter out common words and keep important terms
-                            important_words = [w for w in words if len(w) > 4 and w not in ['what', 'how', 'when', 'where', 'which', 'about', 'will', 'does', 'this', 'that', 'the', 'and', 'for', 'with']]
-                            context_keywords.extend(important_words)
-                        elif msg["role"] == "assistant":
-                            # Extract key terms from previous answers (first 200 chars)
-                            answer_text = msg["content"][:200].lower()
-                            # Extract acronyms and capitalized terms
-                            import re
-                            acronyms = re.findall(r'\b[A-Z]{2,}\b', msg["content"][:200])
-                            context_keywords.extend([a.lower() for a in acronyms])
+                        context_keywords.update(dict.fromkeys(_message_keywords(msg)))
                 
                 # Add context keywords to query if they're relevant
                 if context_keywords:
                     # Check if current question mentions terms from context
-                    prompt_lower = prompt.lower()
-                    relevant_context = [kw for kw in context_keywords if kw in prompt_lower or any(kw in word for word in prompt_lower.split())]
+                    relevant_context = [kw for kw in context_keywords if kw in prompt_lower or any(kw in word for word in prompt_words)]
                     if relevant_context:
-                        query_hints.extend(relevant_context[:5])  # Add top 5 relevant context terms
+                        context_terms = tuple(relevant_context[:5])  # Top 5 relevant context terms
+                        query_hints.update(dict.fromkeys(context_terms))
                 
                 # Expand query based on question type
-                if any(word in prompt.lower() for word in ["where", "how to access", "navigate", "go to", "find"]):
-                    query_hints.extend([
-                        "menu navigation", "how to access", "where to find",
-                        "location in menu", "screen navigation", "menu path",
-                        "access path", "where to navigate"
-                    ])
-                
-                # Database/user creation specific expansion
-                if any(word in prompt.lower() for word in [
-                    "create user", "create schema", "database user", "privileged user", 
-                    "minimally privileged", "schema creation", "database schema",
-                    "SQL user", "grant privileges", "create database user"
-                ]):
-                    query_hints.extend([
-                        "database schema", "SQL create user", "grant privileges",
-                        "database user creation", "SQL commands", "SYSDBA",
-                        "create user identified by", "default tablespace",
-                        "grant create view", "connect to database", "SQL*Plus", "database server"
-                    ])
-                
-                # Connection/database access specific expansion
-                if any(word in prompt.lower() for word in [
-                    "connect to", "database connection", "database server", 
-                    "how to connect", "database access", "SQL connection"
-                ]):
-                    query_hints.extend([
-                        "SQL*Plus", "database connection", "connect as SYS",
-                        "SYSDBA role", "connection string", "database server", "SQL connection"
-                    ])
-                
-                # General "about" questions - add overview/summary keywords
-                if any(phrase in prompt.lower() for phrase in ["what is this", "what is the", "what does this", "what is it about", "about this", "tell me about"]):
-                    query_hints.extend([
-                        "overview", "summary", "introduction", "executive summary", 
-                        "document purpose", "what is", "description", "about",
-                        "white paper", "document content", "main topic", "subject"
-                    ])
-                
-                if any(word in prompt.lower() for word in ["what", "explain", "describe", "tell me about"]):
-                    query_hints.append("information details explanation")
-                
-                if any(word in prompt.lower() for word in ["how", "steps", "process", "procedure"]):
-                    query_hints.append("steps procedure process method")
-                
-                # AIDP/AI Data Platform specific expansion
-                if any(term in prompt.lower() for term in ["aidp", "ai data platform", "oracle ai data platform"]):
-                    query_hints.extend([
-                        "AI Data Platform", "AIDP", "Oracle AI Data Platform", 
-                        "AI Data Platform Workbench", "AIDP Units", "OCPU", "memory",
-                        "compute cluster", "pricing", "cost", "help", "benefits", "features"
-                    ])
-                
-                # APEX specific expansion (to differentiate from AIDP)
-                if any(term in prompt.lower() for term in ["apex", "application express", "oracle apex"]):
-                    query_hints.extend([
-                        "Oracle APEX", "Application Express", "APEX", 
-                        "workspace", "application builder", "page designer"
-                    ])
+                query_hints.update(dict.fromkeys(category_hints(categories)))
                 
                 if query_hints:
                     expanded_query = f"{prompt} {' '.join(query_hints)}"
                 
-                # Step 1: Generate query embeddings
-                query_embedding = generate_embeddings_for_query(expanded_query)
-                original_embedding = generate_embeddings_for_query(prompt)
+                # Step 1: Generate query embeddings (original + expanded in one batch)
+                query_texts = [prompt] if expanded_query == prompt else [prompt, expanded_query]
+                query_embeddings = asyncio.run(_embed_queries_and_warm_index(query_texts))
                 
-                if not query_embedding:
+                if query_embeddings is None:
                     st.error("Failed to generate query embedding")
                     return
                 
-                # Step 2: Search similar chunks
-                chunks_expanded = search_similar_chunks(query_embedding, top_k=30)
-                chunks_original = search_similar_chunks(original_embedding, top_k=30)
-                
-                # Combine and deduplicate
-                all_chunks = chunks_expanded + chunks_original
-                seen_ids = set()
-                unique_chunks = []
-                for chunk in all_chunks:
-                    chunk_id = chunk.get('chunk_id', '')
-                    if chunk_id not in seen_ids:
-                        seen_ids.add(chunk_id)
-                        unique_chunks.append(chunk)
+                # Reuse the answer to a near-identical earlier question. Retrieval runs on the
+                # expanded query, so key on its embedding (the last one) and on the terms the
+                # conversation history contributed; a bare follow-up never matches another chat
+                answer_key = query_embeddings[-1]
+                cached = get_query_cache().lookup(answer_key, params=context_terms)
+                if cached:
+                    st.markdown(cached['response'])
+                    st.caption("⚡ Answered from cache")
+                    st.session_state.messages.append({"role": "assistant", "content": cached['response']})
+                    return
                 
-                # Sort by distance
-                similar_chunks = sorted(unique_chunks, key=lambda x: x.get('distance', 1.0))
+                # Step 2: Search similar chunks (merged and deduplicated by the database module).
+                # Acronyms are high-signal, so the database only searches chunks containing one;
+                # fall back to an unfiltered search if that leaves too little to work with
+                acronyms = list(dict.fromkeys(ACRONYM_PATTERN.findall(prompt)))
+                similar_chunks = []
+                if acronyms:
+                    similar_chunks = search_similar_chunks(query_embeddings, top_k=30, must_contain=acronyms)
+                filtered_by_acronym = len(similar_chunks) >= MIN_FILTERED_RESULTS
+                if not filtered_by_acronym:
+                    similar_chunks = search_similar_chunks(query_embeddings, top_k=30)
                 
                 # Topic-based filtering: Ensure chunks are relevant to the question topic
-                prompt_lower = prompt.lower()
-                question_keywords = set()
-                
-                # Extract key terms from the question (excluding common words)
-                import re
-                stop_words = {'what', 'how', 'when', 'where', 'which', 'who', 'why', 'will', 'does', 'is', 'are', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'about', 'this', 'that', 'these', 'those'}
-                question_words = [w.lower() for w in re.findall(r'\b\w+\b', prompt) if len(w) > 3 and w.lower() not in stop_words]
-                question_keywords.update(question_words)
-                
-                # Extract acronyms (like AIDP, APEX, OCI, etc.)
-                acronyms = re.findall(r'\b[A-Z]{2,}\b', prompt)
-                question_keywords.update([a.lower() for a in acronyms])
+                keyword_pattern = topic_keyword_pattern(prompt)
                 
                 # Filter chunks to ensure they contain at least one relevant keyword
-                if question_keywords and len(question_keywords) > 0:
+                # (already guaranteed when the database filtered on acronyms)
+                if keyword_pattern is not None and not filtered_by_acronym:
+                    # Lowercase each chunk once; both passes below reuse the result
+                    has_keyword_by_id = {
+                        id(chunk): keyword_pattern.search(chunk.get('chunk_text', '').lower()) is not None
+                        for chunk in similar_chunks
+                    }
                     filtered_chunks = []
                     for chunk in similar_chunks:
-                        chunk_text_lower = chunk.get('chunk_text', '').lower()
-                        # Check if chunk contains any question keywords
-                        keyword_matches = sum(1 for kw in question_keywords if kw in chunk_text_lower)
-                        # If it's an acronym, require exact match
-                        acronym_matches = sum(1 for ac in acronyms if ac.lower() in chunk_text_lower or ac in chunk.get('chunk_text', ''))
+                        has_keyword = has_keyword_by_id[id(chunk)]
                         
                         # Keep chunk if it has keyword matches or if similarity is very good
-                        if keyword_matches > 0 or acronym_matches > 0 or chunk.get('distance', 1.0) < 0.9:
+                        if has_keyword or chunk.get('distance', 1.0) < 0.9:
                             filtered_chunks.append(chunk)
                         # Also keep if it's in top 5 and has decent similarity
                         elif len(filtered_chunks) < 5 and chunk.get('distance', 1.0) < 1.0:
@@ -831,9 +787,7 @@ def chat_page():
                         # Re-sort with keyword matches as priority
                         for chunk in similar_chunks[:15]:
                             if chunk not in filtered_chunks:
-                                chunk_text_lower = chunk.get('chunk_text', '').lower()
-                                keyword_matches = sum(1 for kw in question_keywords if kw in chunk_text_lower)
-                                if keyword_matches > 0:
+                                if has_keyword_by_id[id(chunk)]:
                                     filtered_chunks.append(chunk)
                         
                         # If still not enough, add best matches
@@ -852,44 +806,42 @@ def chat_page():
                     primary_threshold = 1.2
                     fallback_threshold = 1.8
                     
-                    good_chunks = [chunk for chunk in similar_chunks if chunk.get('distance', 1.0) < primary_threshold]
+                    # Gather distances and text lengths once for vectorized filtering
+                    distances = np.fromiter((chunk.get('distance', 1.0) for chunk in similar_chunks), dtype=np.float64, count=len(similar_chunks))
+                    text_lengths = np.fromiter((len(chunk.get('chunk_text', '')) for chunk in similar_chunks), dtype=np.int64, count=len(similar_chunks))
                     
-                    # If no chunks meet primary threshold, use fallback for general questions
-                    if not good_chunks:
-                        # Check if this is a general "about" question - use best available chunks
-                        is_general_question = any(phrase in prompt.lower() for phrase in [
-                            "what is this", "what is the", "what does this", 
-                            "what is it about", "about this", "tell me about",
-                            "what is", "describe this", "explain this"
-                        ])
+                    threshold = primary_threshold
+                    
+                    # If no chunks meet primary threshold, fall back to best available chunks
+                    if not (distances < primary_threshold).any():
+                        threshold = fallback_threshold
+                        has_fallback_matches = bool((distances < fallback_threshold).any())
                         
-                        if is_general_question:
-                            # For general questions, use best available chunks (up to fallback threshold)
-                            good_chunks = [chunk for chunk in similar_chunks if chunk.get('distance', 1.0) < fallback_threshold]
-                            if good_chunks:
+                        # Check if this is a general "about" question
+                        if 'general' in categories:
+                            if has_fallback_matches:
                                 st.info("ℹ️ Using best available matches for your general question.")
-                        else:
-                            # For specific questions, show warning but still use best chunks
-                            good_chunks = [chunk for chunk in similar_chunks if chunk.get('distance', 1.0) < fallback_threshold]
-                            if not good_chunks:
-                                # All chunks have very poor similarity
-                                st.warning("⚠️ I couldn't find highly relevant information for your question.")
-                                st.info("💡 **Suggestions:**")
-                                st.write("- Try rephrasing your question")
-                                st.write("- Ask a more specific question")
-                                st.write("- Use different keywords related to your topic")
-                                
-                                # Show debug info
-                                with st.expander("🔍 Debug: Why no good matches?"):
-                                    st.write(f"**All {len(similar_chunks)} retrieved chunks have high similarity scores (poor matches):**")
-                                    for i, chunk in enumerate(similar_chunks[:5], 1):
-                                        st.write(f"**Chunk {i}:** Score {chunk.get('distance', 0):.4f} - {chunk.get('doc_name', 'Unknown')} Page {chunk.get('page_number', 0)}")
-                                        st.write(f"Preview: {chunk.get('chunk_text', '')[:200]}...")
-                                return
+                        elif not has_fallback_matches:
+                            # All chunks have very poor similarity
+                            st.warning("⚠️ I couldn't find highly relevant information for your question.")
+                            st.info("💡 **Suggestions:**")
+                            st.write("- Try rephrasing your question")
+                            st.write("- Ask a more specific question")
+                            st.write("- Use different keywords related to your topic")
+                            
+                            # Show debug info
+                            with st.expander("🔍 Debug: Why no good matches?"):
+                                st.write(f"**All {len(similar_chunks)} retrieved chunks have high similarity scores (poor matches):**")
+                                for i, chunk in enumerate(similar_chunks[:5], 1):
+                                    st.write(f"**Chunk {i}:** Score {chunk.get('distance', 0):.4f} - {chunk.get('doc_name', 'Unknown')} Page {chunk.get('page_number', 0)}")
+                                    st.write(f"Preview: {chunk.get('chunk_text', '')[:200]}...")
+                            return
                     
-                    # Filter out chunks that are too short
-                    filtered_chunks = [chunk for chunk in good_chunks if len(chunk.get('chunk_text', '')) > 50]
-                    similar_chunks = filtered_chunks[:15]
+                    # Keep chunks under the threshold that are not too short, in one mask,
+                    # then order them by similarity (most relevant first) with a stable argsort
+                    keep = np.flatnonzero((distances < threshold) & (text_lengths > 50))[:15]
+                    keep = keep[np.argsort(distances[keep], kind='stable')]
+                    similar_chunks = [similar_chunks[i] for i in keep]
                 else:
                     similar_chunks = []
                 
@@ -910,20 +862,29 @@ def chat_page():
                             st.write("---")
                 
                 # Check if we have relevant chunks
+                response_error = "Failed to generate response"
                 if not similar_chunks:
                     response = "I couldn't find relevant information in the documents for your question. Please try rephrasing or ask about a different topic."
                 else:
-                    # Ensure chunks are sorted by similarity (most relevant first)
-                    similar_chunks = sorted(similar_chunks, key=lambda x: x.get('distance', 1.0))
-                    
-                    # Step 3: Generate AI response
-                    response = generate_rag_response(prompt, similar_chunks)
+                    # Step 3: Stream the AI response, then replace it with the cleaned-up answer
+                    answer_placeholder = st.empty()
+                    try:
+                        with answer_placeholder.container():
+                            raw_response = st.write_stream(generate_rag_response_stream(prompt, similar_chunks))
+                        response = clean_answer(raw_response) if isinstance(raw_response, str) else None
+                    except RuntimeError as e:
+                        # A stream that failed part-way is neither cached nor kept in the history
+                        response, response_error = None, str(e)
+                    answer_placeholder.empty()
+                    if response:
+                        get_query_cache().add(answer_key, {'response': response}, params=context_terms)
                 
                 if response:
                     st.markdown(response)
                     st.session_state.messages.append({"role": "assistant", "content": response})
                 else:
-                    st.error("Failed to generate response")
+                    # Shown outside the placeholder so clearing the partial answer keeps it visible
+                    st.error(response_error)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
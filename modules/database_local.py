@@ -7,136 +7,238 @@ Handles document storage, chunk storage, and vector search
 import chromadb
 from chromadb.config import Settings
 import streamlit as st
+import numpy as np
 from datetime import datetime
+import logging
 import os
 import re
 import uuid
+from modules.query_cache import get_search_cache, SEARCH_CACHE_SIMILARITY_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# HNSW index configuration (graph degree, build and query beam widths)
+HNSW_M = 32
+HNSW_CONSTRUCTION_EF = 200
+HNSW_SEARCH_EF = 64
+
+# Characters not allowed in chunk IDs
+UNSAFE_ID_CHARS = re.compile(r'[^a-zA-Z0-9_-]')
 
 # Initialize ChromaDB client (persistent storage)
+@st.cache_resource(show_spinner=False)
+def _open_collection():
+    """Open the client and collection once per process (raises on failure so errors aren't cached)"""
+    # Store database in project folder
+    db_path = os.path.join(os.getcwd(), "data", "chroma_db")
+    os.makedirs(db_path, exist_ok=True)
+    
+    client = chromadb.PersistentClient(path=db_path)
+    
+    # Get or create collection. ChromaDB only applies hnsw:* metadata when the
+    # collection is created: a database created with other settings keeps its
+    # old index until it is rebuilt (delete data/chroma_db and re-ingest)
+    hnsw_settings = {
+        "hnsw:M": HNSW_M,
+        "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": HNSW_SEARCH_EF
+    }
+    collection = client.get_or_create_collection(
+        name="documents",
+        metadata={"description": "Document chunks with embeddings", **hnsw_settings}
+    )
+    
+    existing = collection.metadata or {}
+    outdated = [key for key, value in hnsw_settings.items() if existing.get(key) != value]
+    if outdated:
+        logger.warning(
+            "Collection 'documents' was created with different index settings (%s); "
+            "delete %s and re-ingest the documents to apply the current ones",
+            ", ".join(f"{key}={existing.get(key)}" for key in outdated), db_path
+        )
+    return client, collection
+
 def get_chroma_client():
-    """Get or create ChromaDB client"""
+    """Get or create ChromaDB client (cached for performance)"""
     try:
-        # Store database in project folder
-        db_path = os.path.join(os.getcwd(), "data", "chroma_db")
-        os.makedirs(db_path, exist_ok=True)
-        
-        client = chromadb.PersistentClient(path=db_path)
+        client, _ = _open_collection()
         return client
     except Exception as e:
         st.error(f"Error creating ChromaDB client: {e}")
         return None
 
 def get_or_create_collection():
-    """Get or create the documents collection"""
+    """Get or create the documents collection (cached for performance)"""
     try:
-        client = get_chroma_client()
-        if client is None:
-            return None
-        
-        # Get or create collection
-        collection = client.get_or_create_collection(
-            name="documents",
-            metadata={"description": "Document chunks with embeddings"}
-        )
+        _, collection = _open_collection()
         return collection
     except Exception as e:
         st.error(f"Error getting collection: {e}")
         return None
 
-def store_document_chunks(doc_name, chunks_data):
+def add_document_chunks(doc_name, chunks_data, embeddings=None, upload_id=None):
+    """
+    Store document chunks in ChromaDB
+    
+    Args:
+        doc_name: Name of the document
+        chunks_data: List of dicts with keys: chunk_text, chunk_index, page_number
+        embeddings: float32 array of shape (len(chunks_data), dim), row-aligned with
+            chunks_data; when omitted each chunk dict must carry an 'embeddings' key
+        upload_id: Optional identifier shared by all batches of one document upload
+    
+    Raises on failure instead of reporting it, so callers running off the
+    Streamlit script thread (the ingestion pipeline) can surface errors themselves.
+    """
+    _, collection = _open_collection()
+    
+    # Sanitize document name
+    safe_doc_name = UNSAFE_ID_CHARS.sub('_', doc_name)
+    
+    # Prepare data for ChromaDB
+    ids = []
+    documents = []
+    metadatas = []
+    
+    # Generate unique IDs using UUID (batches of one upload share it)
+    doc_uuid = upload_id or str(uuid.uuid4())[:8]  # Short unique identifier
+    
+    for idx, chunk in enumerate(chunks_data):
+        # Create unique ID
+        chunk_id = f"{safe_doc_name}_{doc_uuid}_chunk_{chunk.get('chunk_index', idx)}"
+        ids.append(chunk_id)
+        documents.append(chunk['chunk_text'])
+        metadatas.append({
+            'doc_name': doc_name,
+            'chunk_index': chunk.get('chunk_index', idx),
+            'page_number': chunk.get('page_number', 0),
+            'upload_id': doc_uuid,
+            'created_at': datetime.now().isoformat()
+        })
+    
+    # Collect vectors as one contiguous float32 matrix (lists are only built for the
+    # ChromaDB call itself); chunks may carry arrays or lists under 'embeddings'
+    if embeddings is None:
+        embeddings = [chunk['embeddings'] for chunk in chunks_data]
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    
+    # Add to collection
+    collection.add(
+        ids=ids,
+        documents=documents,
+        embeddings=embeddings.tolist(),
+        metadatas=metadatas
+    )
+    
+    get_search_cache().clear()
+
+def store_document_chunks(doc_name, chunks_data, embeddings=None, upload_id=None):
     """
     Store document chunks in ChromaDB
     
     Args:
         doc_name: Name of the document
-        chunks_data: List of dicts with keys: chunk_text, chunk_index, page_number, embeddings
+        chunks_data: List of dicts with keys: chunk_text, chunk_index, page_number
+        embeddings: float32 array of shape (len(chunks_data), dim), row-aligned with
+            chunks_data; when omitted each chunk dict must carry an 'embeddings' key
+        upload_id: Optional identifier shared by all batches of one document upload
     """
     try:
-        collection = get_or_create_collection()
-        if collection is None:
-            return False
-        
-        # Sanitize document name
-        safe_doc_name = re.sub(r'[^a-zA-Z0-9_-]', '_', doc_name)
-        
-        # Prepare data for ChromaDB
-        ids = []
-        documents = []
-        embeddings = []
-        metadatas = []
-        
-        # Generate unique IDs using UUID
-        doc_uuid = str(uuid.uuid4())[:8]  # Short unique identifier
-        
-        for idx, chunk in enumerate(chunks_data):
-            # Create unique ID
-            chunk_id = f"{safe_doc_name}_{doc_uuid}_chunk_{idx}"
-            ids.append(chunk_id)
-            documents.append(chunk['chunk_text'])
-            embeddings.append(chunk['embeddings'])
-            metadatas.append({
-                'doc_name': doc_name,
-                'chunk_index': chunk.get('chunk_index', idx),
-                'page_number': chunk.get('page_number', 0),
-                'created_at': datetime.now().isoformat()
-            })
-        
-        # Add to collection
-        collection.add(
-            ids=ids,
-            documents=documents,
-            embeddings=embeddings,
-            metadatas=metadatas
-        )
-        
+        add_document_chunks(doc_name, chunks_data, embeddings, upload_id)
         return True
     except Exception as e:
         st.error(f"Error storing document chunks: {e}")
         return False
 
-def search_similar_chunks(query_embedding, top_k=5, doc_name_filter=None):
+def search_similar_chunks(query_embedding, top_k=5, doc_name_filter=None, must_contain=None):
     """
     Search for similar chunks using vector similarity
     
     Args:
-        query_embedding: Embedding vector of the query
-        top_k: Number of results to return
+        query_embedding: Embedding vector of the query, or a list of vectors
+            to search with in a single call (results are merged)
+        top_k: Number of results to return per query vector
         doc_name_filter: Optional document name to filter by
+        must_contain: Optional list of terms; only chunks whose text contains at
+            least one of them are searched. Each term also matches in lowercase,
+            uppercase and capitalized form, since $contains is case-sensitive
     
     Returns:
-        List of similar chunks with metadata
+        List of similar chunks with metadata, sorted by distance
     """
     try:
         collection = get_or_create_collection()
         if collection is None:
             return []
         
+        # Accept one vector or several as a 2-D array
+        query_embeddings = np.asarray(query_embedding, dtype=np.float32)
+        if query_embeddings.ndim == 1:
+            query_embeddings = query_embeddings.reshape(1, -1)
+        
+        # Near-identical queries with the same search parameters reuse earlier
+        # results (the cache is cleared on writes)
+        search_cache = get_search_cache()
+        cache_key = query_embeddings.mean(axis=0)
+        search_params = (len(query_embeddings), top_k, doc_name_filter, tuple(must_contain or ()))
+        cached = search_cache.lookup(cache_key, threshold=SEARCH_CACHE_SIMILARITY_THRESHOLD, params=search_params)
+        if cached:
+            return list(cached['results'])
+        
         # Prepare where clause if filtering by document
         where_clause = None
         if doc_name_filter:
             where_clause = {"doc_name": doc_name_filter}
         
-        # Query collection
+        # Let the database skip chunks without any required term, in any usual casing
+        where_document = None
+        if must_contain:
+            variants = dict.fromkeys(
+                variant for term in must_contain
+                for variant in (term, term.lower(), term.upper(), term.capitalize())
+            )
+            conditions = [{"$contains": variant} for variant in variants]
+            where_document = conditions[0] if len(conditions) == 1 else {"$or": conditions}
+        
+        # Query collection once for all vectors
         results = collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=query_embeddings.tolist(),
             n_results=top_k,
-            where=where_clause if where_clause else None
+            where=where_clause if where_clause else None,
+            where_document=where_document
         )
         
+        # Flatten the per-vector result lists
+        ids = [chunk_id for row in (results['ids'] or []) for chunk_id in row]
+        if not ids:
+            return []
+        positions = [(q, i) for q, row in enumerate(results['ids']) for i in range(len(row))]
+        if results.get('distances'):
+            distances = np.array([d for row in results['distances'] for d in row], dtype=np.float64)
+        else:
+            distances = np.zeros(len(ids), dtype=np.float64)
+        
+        # Sort by distance, then keep the first (closest) hit of each chunk
+        order = np.argsort(distances, kind='stable')
+        _, first_seen = np.unique(np.array(ids)[order], return_index=True)
+        best = order[np.sort(first_seen)]
+        
         # Format results
         formatted_results = []
-        if results['ids'] and len(results['ids'][0]) > 0:
-            for i in range(len(results['ids'][0])):
-                formatted_results.append({
-                    'chunk_id': results['ids'][0][i],
-                    'chunk_text': results['documents'][0][i],
-                    'doc_name': results['metadatas'][0][i].get('doc_name', 'Unknown'),
-                    'chunk_index': results['metadatas'][0][i].get('chunk_index', 0),
-                    'page_number': results['metadatas'][0][i].get('page_number', 0),
-                    'distance': results['distances'][0][i] if 'distances' in results else 0
-                })
+        for k in best:
+            q, i = positions[k]
+            metadata = results['metadatas'][q][i]
+            formatted_results.append({
+                'chunk_id': ids[k],
+                'chunk_text': results['documents'][q][i],
+                'doc_name': metadata.get('doc_name', 'Unknown'),
+                'chunk_index': metadata.get('chunk_index', 0),
+                'page_number': metadata.get('page_number', 0),
+                'distance': float(distances[k])
+            })
         
-        return formatted_results
+        search_cache.add(cache_key, {'results': formatted_results}, params=search_params)
+        return list(formatted_results)
     except Exception as e:
         st.error(f"Error searching chunks: {e}")
         return []
@@ -176,8 +278,24 @@ def delete_document(doc_name):
         if all_data['ids']:
             # Delete all chunks
             collection.delete(ids=all_data['ids'])
+            get_search_cache().clear()
         
         return True
     except Exception as e:
         st.error(f"Error deleting document: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def remove_upload(upload_id):
+    """Delete all chunks stored by one upload (raises on failure; see delete_upload)"""
+    _, collection = _open_collection()
+    collection.delete(where={"upload_id": upload_id})
+    get_search_cache().clear()
+
+def delete_upload(upload_id):
+    """Delete all chunks stored by one upload (rolls back a partially stored document)"""
+    try:
+        remove_upload(upload_id)
+        return True
+    except Exception as e:
+        st.error(f"Error deleting upload: {e}")
+        return False
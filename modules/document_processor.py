@@ -6,14 +6,28 @@ Handles document validation, text extraction, and chunking
 
 import streamlit as st
 import PyPDF2
+import os
 import re
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from langdetect import detect, LangDetectException
 
+# pypdfium2 (native PDFium) extracts text much faster than PyPDF2; optional
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# PDFium is not thread-safe, so calls from concurrent sessions are serialized
+_pdfium_lock = threading.Lock()
+
 # Chunking configuration
 TARGET_CHUNK_SIZE = 1500
 MAX_CHUNK_SIZE = 2000
 OVERLAP_SIZE = 200
 MIN_TEXT_LENGTH = 200
+SENTENCE_SPLIT_PATTERN = re.compile(r'(?<=[.!?])\s+')
 
 def validate_document_requirements(uploaded_file):
     """Validate document meets requirements"""
@@ -45,16 +59,11 @@ def validate_document_requirements(uploaded_file):
 def validate_pdf_document(pdf_file):
     """Validate PDF is text-based"""
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        # Check first 3 pages
+        total_pages, first_pages = _read_first_pdf_pages(pdf_file, 3)
         text_content = ""
-        total_pages = len(pdf_reader.pages)
         
-        # Check first 3 pages
-        pages_to_check = min(3, total_pages)
-        for i in range(pages_to_check):
-            page = pdf_reader.pages[i]
-            page_text = page.extract_text()
-            
+        for i, page_text in enumerate(first_pages):
             if not page_text.strip():
                 return False, f"Page {i+1} appears to be image-only. Only text-based PDFs are supported."
             
@@ -67,6 +76,37 @@ def validate_pdf_document(pdf_file):
     except Exception as e:
         return False, f"Error validating PDF: {e}"
 
+def _read_first_pdf_pages(pdf_file, max_pages):
+    """
+    Read the page count and the text of the first pages of a PDF
+    
+    Uses pypdfium2 when available, so an upload is parsed by the same library
+    that later extracts it; PyPDF2 is the fallback.
+    
+    Returns:
+        tuple: (total_pages, list of page texts for up to max_pages pages)
+    """
+    if pdfium is None:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        total_pages = len(pdf_reader.pages)
+        return total_pages, [pdf_reader.pages[i].extract_text() for i in range(min(max_pages, total_pages))]
+    
+    pdf_file.seek(0)
+    page_texts = []
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_file)
+        try:
+            total_pages = len(pdf)
+            for page_num in range(min(max_pages, total_pages)):
+                page = pdf[page_num]
+                textpage = page.get_textpage()
+                page_texts.append(textpage.get_text_range().replace('\r\n', '\n'))
+                textpage.close()
+                page.close()
+        finally:
+            pdf.close()
+    return total_pages, page_texts
+
 def validate_docx_document(docx_file):
     """Validate DOCX contains text"""
     try:
@@ -85,7 +125,13 @@ def validate_docx_document(docx_file):
         return False, f"Error validating DOCX: {e}"
 
 def extract_text_from_document(uploaded_file):
-    """Extract text from uploaded PDF or DOCX file"""
+    """
+    Extract text from uploaded PDF or DOCX file
+    
+    Returns:
+        Generator yielding dicts with keys: page_number, text (one page at a time),
+        or None for unsupported files. Extraction errors are raised while iterating.
+    """
     try:
         file_extension = uploaded_file.name.lower().split('.')[-1]
         
@@ -101,60 +147,111 @@ def extract_text_from_document(uploaded_file):
         return None
 
 def extract_text_from_pdf(pdf_file):
-    """Extract text from PDF with page tracking"""
+    """Extract text from PDF with page tracking, yielding one page at a time"""
+    if pdfium is not None:
+        yield from _extract_text_from_pdf_pdfium(pdf_file)
+        return
+    
+    pdf_reader = PyPDF2.PdfReader(pdf_file)
+    
+    for page_num, page in enumerate(pdf_reader.pages):
+        page_text = page.extract_text()
+        if page_text.strip():
+            yield {
+                'page_number': page_num + 1,
+                'text': page_text.strip()
+            }
+
+def _extract_text_from_pdf_pdfium(pdf_file):
+    """Extract text page by page with pypdfium2"""
+    pdf_file.seek(0)
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_file)
+        page_count = len(pdf)
+    
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        pages_data = []
-        
-        for page_num, page in enumerate(pdf_reader.pages):
-            page_text = page.extract_text()
+        for page_num in range(page_count):
+            with _pdfium_lock:
+                page = pdf[page_num]
+                textpage = page.get_textpage()
+                # PDFium separates lines with \r\n; paragraph splitting expects \n
+                page_text = textpage.get_text_range().replace('\r\n', '\n')
+                textpage.close()
+                page.close()
+            
             if page_text.strip():
-                pages_data.append({
+                yield {
                     'page_number': page_num + 1,
                     'text': page_text.strip()
-                })
-        
-        return pages_data
-    except Exception as e:
-        st.error(f"Error extracting text from PDF: {e}")
-        return None
+                }
+    finally:
+        with _pdfium_lock:
+            pdf.close()
 
 def extract_text_from_docx(docx_file):
-    """Extract text from DOCX"""
-    try:
-        import docx
-        doc = docx.Document(docx_file)
-        pages_data = []
-        
-        current_section = ""
-        section_count = 0
-        
-        for paragraph in doc.paragraphs:
-            text = paragraph.text.strip()
-            if text:
-                current_section += text + "\n\n"
-                
-                # Create sections every ~1000 characters
-                if len(current_section) > 1000:
-                    section_count += 1
-                    pages_data.append({
-                        'page_number': section_count,
-                        'text': current_section.strip()
-                    })
-                    current_section = ""
-        
-        # Add remaining text
-        if current_section.strip():
-            section_count += 1
-            pages_data.append({
-                'page_number': section_count,
-                'text': current_section.strip()
-            })
-        
-        return pages_data
-    except Exception as e:
-        st.error(f"Error extracting text from DOCX: {e}")
-        return None
+    """Extract text from DOCX, yielding one ~1000 character section at a time"""
+    import docx
+    doc = docx.Document(docx_file)
+    
+    # Collect paragraphs in a list with a running length instead of growing a string
+    section_parts = []
+    section_len = 0
+    section_count = 0
+    
+    for paragraph in doc.paragraphs:
+        text = paragraph.text.strip()
+        if text:
+            section_parts.append(text)
+            section_len += len(text) + 2  # Paragraphs are separated by a blank line
+            
+            # Create sections every ~1000 characters
+            if section_len > 1000:
+                section_count += 1
+                yield {
+                    'page_number': section_count,
+                    'text': "\n\n".join(section_parts)
+                }
+                section_parts = []
+                section_len = 0
+    
+    # Add remaining text
+    if section_parts:
+        section_count += 1
+        yield {
+            'page_number': section_count,
+            'text': "\n\n".join(section_parts)
+        }
+
+def _window(lengths, max_size, sep_len):
+    """
+    Greedily pack consecutive pieces into windows of at most max_size characters
+    
+    Works on piece lengths only, so no intermediate strings are built.
+    
+    Args:
+        lengths: Character length of each piece
+        max_size: Maximum window length (a single oversized piece gets its own window)
+        sep_len: Length of the separator placed between pieces
+    
+    Returns:
+        List of (start, end) piece index pairs, end exclusive
+    """
+    windows = []
+    start = 0
+    current = 0
+    
+    for idx, length in enumerate(lengths):
+        if current + length > max_size and current:
+            windows.append((start, idx))
+            start = idx
+            current = length
+        else:
+            current = current + sep_len + length if current else length
+    
+    if start < len(lengths):
+        windows.append((start, len(lengths)))
+    
+    return windows
 
 def hybrid_chunking(text, target_size=TARGET_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE, overlap=OVERLAP_SIZE):
     """Hybrid chunking: sentence-aware with size control"""
@@ -162,7 +259,10 @@ def hybrid_chunking(text, target_size=TARGET_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE
         return [text] if text else []
     
     chunks = []
-    current_chunk = ""
+    # Collect paragraphs in a list and track the joined length as an int,
+    # instead of re-concatenating the growing chunk string for every paragraph
+    current_parts = []
+    current_len = 0
     
     # Split by paragraphs first
     paragraphs = text.split('\n\n')
@@ -173,15 +273,22 @@ def hybrid_chunking(text, target_size=TARGET_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE
             continue
         
         # If adding this paragraph exceeds max size, save current chunk
-        if len(current_chunk) + len(paragraph) > max_size and current_chunk:
+        if current_len + len(paragraph) > max_size and current_len:
+            current_chunk = "\n\n".join(current_parts)
             chunks.append(current_chunk.strip())
             # Start new chunk with overlap
             overlap_text = current_chunk[-overlap:] if overlap > 0 else ""
-            current_chunk = overlap_text + "\n\n" + paragraph
+            current_parts = [overlap_text, paragraph]
+            current_len = len(overlap_text) + 2 + len(paragraph)
+        elif current_len:
+            current_parts.append(paragraph)
+            current_len += 2 + len(paragraph)
         else:
-            current_chunk += "\n\n" + paragraph if current_chunk else paragraph
+            current_parts = [paragraph]
+            current_len = len(paragraph)
     
     # Add the last chunk
+    current_chunk = "\n\n".join(current_parts)
     if current_chunk.strip():
         chunks.append(current_chunk.strip())
     
@@ -192,17 +299,66 @@ def hybrid_chunking(text, target_size=TARGET_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE
             final_chunks.append(chunk)
         else:
             # Split by sentences
-            sentences = re.split(r'(?<=[.!?])\s+', chunk)
-            temp_chunk = ""
-            
-            for sentence in sentences:
-                if len(temp_chunk) + len(sentence) > max_size and temp_chunk:
-                    final_chunks.append(temp_chunk.strip())
-                    temp_chunk = sentence
-                else:
-                    temp_chunk += " " + sentence if temp_chunk else sentence
-            
-            if temp_chunk.strip():
-                final_chunks.append(temp_chunk.strip())
+            sentences = SENTENCE_SPLIT_PATTERN.split(chunk)
+            for start, end in _window([len(sentence) for sentence in sentences], max_size, 1):
+                temp_chunk = " ".join(sentences[start:end]).strip()
+                if temp_chunk:
+                    final_chunks.append(temp_chunk)
+    
+    return final_chunks
+
+def chunk_pages(pages_data, max_workers=None, start_index=0, executor=None):
+    """
+    Chunk pages in parallel and number the chunks in page order
+    
+    Args:
+        pages_data: List of dicts with keys: page_number, text
+        max_workers: Number of chunking threads (defaults to the CPU count)
+        start_index: chunk_index of the first chunk (for documents chunked in windows)
+        executor: Optional existing executor to reuse across calls
+    
+    Returns:
+        List of dicts with keys: chunk_text, chunk_index, page_number
+    """
+    chunk_page = lambda page: hybrid_chunking(page['text'])
+    if executor is not None:
+        chunks_per_page = list(executor.map(chunk_page, pages_data))
+    elif len(pages_data) <= 1:
+        # Not worth starting threads for a single page
+        chunks_per_page = [chunk_page(page) for page in pages_data]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 4) as pool:
+            chunks_per_page = list(pool.map(chunk_page, pages_data))
+    
+    # Assign chunk indices after the map so numbering is deterministic
+    all_chunks = []
+    for page_data, chunks in zip(pages_data, chunks_per_page):
+        for chunk_text in chunks:
+            all_chunks.append({
+                'chunk_text': chunk_text,
+                'chunk_index': start_index + len(all_chunks),
+                'page_number': page_data['page_number']
+            })
+    
+    return all_chunks
+
+def iter_chunks(pages, window_size=None, executor=None):
+    """
+    Lazily chunk an iterable of pages, a window of pages at a time
+    
+    Args:
+        pages: Iterable (e.g. a generator) of dicts with keys: page_number, text
+        window_size: Pages chunked in parallel per step (defaults to the CPU count)
+        executor: Optional existing executor to reuse across windows
+    
+    Yields:
+        Dicts with keys: chunk_text, chunk_index, page_number
+    """
+    window_size = window_size or os.cpu_count() or 4
+    page_iter = iter(pages)
+    chunk_count = 0
     
-    return final_chunks
\ No newline at end of file
+    while window := list(islice(page_iter, window_size)):
+        window_chunks = chunk_pages(window, max_workers=window_size, start_index=chunk_count, executor=executor)
+        chunk_count += len(window_chunks)
+        yield from window_chunks
@@ -6,43 +6,284 @@ Generates vector embeddings for text chunks and queries
 
 from sentence_transformers import SentenceTransformer
 import streamlit as st
+import torch
+import numpy as np
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Using a small, fast model that works well for RAG
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# SQLite limits the number of bound parameters per statement
+CACHE_LOOKUP_BATCH = 500
+
+# In-process LRU in front of the on-disk cache (hash -> float32 vector)
+MEMORY_CACHE_SIZE = 1024
+
+# Rows kept in the on-disk cache (~1.5 KB each); the oldest written are pruned
+# down to DISK_CACHE_PRUNE_TO once DISK_CACHE_MAX_ROWS is exceeded
+DISK_CACHE_MAX_ROWS = 50000
+DISK_CACHE_PRUNE_TO = 45000
+
+# Serializes access to the shared cache connection across sessions
+_cache_lock = threading.Lock()
+_memory_cache = OrderedDict()
+
+def _remember(text_hash, embedding):
+    """Add an embedding to the in-process LRU (caller holds _cache_lock)"""
+    _memory_cache[text_hash] = embedding
+    _memory_cache.move_to_end(text_hash)
+    if len(_memory_cache) > MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
 
 # Load model once (cached)
-@st.cache_resource
+@st.cache_resource(show_spinner=False)
+def _load_model():
+    """Load the sentence transformer model once per process (raises on failure so errors aren't cached)"""
+    # Prefer CUDA, then Apple Silicon (MPS), then CPU
+    if torch.cuda.is_available():
+        device = 'cuda'
+    elif getattr(torch.backends, 'mps', None) is not None and torch.backends.mps.is_available():
+        device = 'mps'
+    else:
+        device = 'cpu'
+    
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+    
+    # Half precision doubles GPU throughput; outputs are cast back to float32
+    if device != 'cpu':
+        model = model.half()
+    return model
+
 def load_embedding_model():
     """Load the sentence transformer model (cached for performance)"""
     try:
-        # Using a small, fast model that works well for RAG
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        return model
+        return _load_model()
     except Exception as e:
         st.error(f"Error loading embedding model: {e}")
         return None
 
+@st.cache_resource(show_spinner=False)
+def get_embedding_cache():
+    """Open the on-disk embedding cache (cached for performance)"""
+    try:
+        # Store cache next to the vector database
+        cache_dir = os.path.join(os.getcwd(), "data")
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        conn = sqlite3.connect(
+            os.path.join(cache_dir, "embeddings_cache.sqlite"),
+            check_same_thread=False
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings_cache ("
+            "hash BLOB NOT NULL, model TEXT NOT NULL, vec BLOB NOT NULL, "
+            "PRIMARY KEY (hash, model))"
+        )
+        conn.commit()
+        return conn
+    except Exception as e:
+        # The cache is only an optimization; embeddings are computed without it
+        logger.warning("Embedding cache unavailable: %s", e)
+        return None
+
+def _text_hash(text):
+    """Content hash used as the cache key for a text"""
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+def get_cached_embeddings(texts):
+    """
+    Look up previously computed embeddings
+    
+    Args:
+        texts: List of text strings
+    
+    Returns:
+        dict: Maps index in texts to its cached float32 embedding (misses are absent)
+    """
+    if not texts:
+        return {}
+    
+    try:
+        hashes = [_text_hash(text) for text in texts]
+        found = {}
+        with _cache_lock:
+            # Recently used vectors (e.g. repeated questions) skip SQLite entirely
+            for text_hash in set(hashes):
+                if text_hash in _memory_cache:
+                    _memory_cache.move_to_end(text_hash)
+                    found[text_hash] = _memory_cache[text_hash]
+            
+            conn = get_embedding_cache()
+            unique_hashes = list(set(hashes) - found.keys()) if conn is not None else []
+            for start in range(0, len(unique_hashes), CACHE_LOOKUP_BATCH):
+                batch = unique_hashes[start:start + CACHE_LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT hash, vec FROM embeddings_cache WHERE model = ? AND hash IN ({placeholders})",
+                    [EMBEDDING_MODEL_NAME, *batch]
+                ).fetchall()
+                for row_hash, vec in rows:
+                    row_hash = bytes(row_hash)
+                    found[row_hash] = np.frombuffer(vec, dtype=np.float32)
+                    _remember(row_hash, found[row_hash])
+        
+        return {i: found[h] for i, h in enumerate(hashes) if h in found}
+    except Exception as e:
+        logger.warning("Error reading embedding cache: %s", e)
+        return {}
+
+def store_cached_embeddings(texts, embeddings):
+    """Save computed embeddings to the in-process and on-disk caches"""
+    if not texts:
+        return
+    
+    try:
+        vectors = [np.asarray(embedding, dtype=np.float32) for embedding in embeddings]
+        hashes = [_text_hash(text) for text in texts]
+        conn = get_embedding_cache()
+        with _cache_lock:
+            # A fresh vector (e.g. a new question) is served from memory next time
+            for text_hash, vector in zip(hashes, vectors):
+                _remember(text_hash, vector)
+            
+            if conn is None:
+                return
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings_cache (hash, model, vec) VALUES (?, ?, ?)",
+                [(text_hash, EMBEDDING_MODEL_NAME, vector.tobytes()) for text_hash, vector in zip(hashes, vectors)]
+            )
+            
+            # Replaced rows get a new rowid, so rowid order is write order
+            row_count = conn.execute("SELECT COUNT(*) FROM embeddings_cache").fetchone()[0]
+            if row_count > DISK_CACHE_MAX_ROWS:
+                conn.execute(
+                    "DELETE FROM embeddings_cache WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings_cache ORDER BY rowid LIMIT ?)",
+                    (row_count - DISK_CACHE_PRUNE_TO,)
+                )
+            conn.commit()
+    except Exception as e:
+        logger.warning("Error writing embedding cache: %s", e)
+
 def generate_embeddings_for_chunk(chunk_text):
-    """Generate embeddings for a text chunk"""
+    """Generate embeddings for a text chunk (float32 numpy vector)"""
     try:
+        cached = get_cached_embeddings([chunk_text])
+        if cached:
+            return cached[0]
+        
         model = load_embedding_model()
         if model is None:
             return None
         
-        # Generate embedding (returns numpy array, convert to list)
-        embedding = model.encode(chunk_text, convert_to_numpy=True)
-        return embedding.tolist()
+        # Keep the contiguous float32 array; lists of Python floats take ~7x the memory
+        embedding = model.encode(chunk_text, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+        store_cached_embeddings([chunk_text], [embedding])
+        return embedding
     except Exception as e:
         st.error(f"Error generating embeddings for chunk: {e}")
         return None
 
 def generate_embeddings_for_query(query_text):
-    """Generate embeddings for a search query"""
+    """Generate embeddings for a search query (float32 numpy vector)"""
     try:
+        # Repeated questions are served from the cache
+        cached = get_cached_embeddings([query_text])
+        if cached:
+            return cached[0]
+        
         model = load_embedding_model()
         if model is None:
             return None
         
         # Generate embedding
-        embedding = model.encode(query_text, convert_to_numpy=True)
-        return embedding.tolist()
+        embedding = model.encode(query_text, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+        store_cached_embeddings([query_text], [embedding])
+        return embedding
     except Exception as e:
         st.error(f"Error generating embeddings for query: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def embed_texts(texts, batch_size=64, progress_callback=None):
+    """
+    Generate embeddings for many texts with batched model calls
+    
+    Raises on failure instead of reporting it, so callers running off the
+    Streamlit script thread (the ingestion pipeline) can surface errors themselves.
+    
+    Args:
+        texts: List of text strings to embed
+        batch_size: Number of texts encoded per model call
+        progress_callback: Optional callable(done, total) invoked after each batch
+    
+    Returns:
+        float32 array of shape (len(texts), dim) in the same order as texts
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    
+    # Serve cache hits directly and only encode the misses
+    cached = get_cached_embeddings(texts)
+    embeddings = [cached.get(i) for i in range(len(texts))]
+    misses = [i for i in range(len(texts)) if i not in cached]
+    
+    if progress_callback and cached:
+        progress_callback(len(cached), len(texts))
+    
+    if not misses:
+        return np.vstack(embeddings)
+    
+    model = _load_model()
+    
+    # Sort by length so each batch pads to a similar sequence length
+    order = sorted(misses, key=lambda i: len(texts[i]))
+    
+    for start in range(0, len(order), batch_size):
+        batch_order = order[start:start + batch_size]
+        batch_embeddings = model.encode(
+            [texts[i] for i in batch_order],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        
+        # Put results back in the original order
+        for i, embedding in zip(batch_order, batch_embeddings):
+            embeddings[i] = embedding.astype(np.float32, copy=False)
+        
+        store_cached_embeddings(
+            [texts[i] for i in batch_order],
+            [embeddings[i] for i in batch_order]
+        )
+        
+        if progress_callback:
+            done = len(cached) + min(start + batch_size, len(order))
+            progress_callback(done, len(texts))
+    
+    return np.vstack(embeddings)
+
+def generate_embeddings_batch(texts, batch_size=64, progress_callback=None):
+    """
+    Generate embeddings for many texts with batched model calls
+    
+    Args:
+        texts: List of text strings to embed
+        batch_size: Number of texts encoded per model call
+        progress_callback: Optional callable(done, total) invoked after each batch
+    
+    Returns:
+        float32 array of shape (len(texts), dim) in the same order as texts, or None on error
+    """
+    try:
+        return embed_texts(texts, batch_size, progress_callback)
+    except Exception as e:
+        st.error(f"Error generating embeddings for batch: {e}")
+        return None
@@ -4,300 +4,383 @@ Local LLM Handler using Ollama
 Generates AI responses based on context and user queries
 """
 
+import functools
+import json
+import os
+import re
 import requests
 import streamlit as st
 
 # Ollama configuration
 OLLAMA_URL = "http://localhost:11434/api/generate"
 OLLAMA_MODEL = "gemma3:1b"  # Using the smaller model
+# Requests the server decodes at once (one per chat session in flight); match the
+# server's OLLAMA_NUM_PARALLEL (set it, and OLLAMA_MAX_LOADED_MODELS, before `ollama serve`)
+OLLAMA_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
 
-def generate_rag_response(question, context_chunks, max_tokens=1500):
+# Question phrases that call for more context, each group compiled into one pattern
+COMPLETE_STEPS_PHRASES = (
+    "complete steps", "all steps", "full steps", "entire process",
+    "complete process", "all the steps", "step by step"
+)
+SQL_QUESTION_KEYWORDS = (
+    "sql", "create user", "grant", "database user", "schema",
+    "privileges", "minimally privileged", "sql commands"
+)
+_COMPLETE_STEPS_RE = re.compile('|'.join(map(re.escape, COMPLETE_STEPS_PHRASES)))
+_SQL_QUESTION_RE = re.compile('|'.join(map(re.escape, SQL_QUESTION_KEYWORDS)))
+# Context budget per prompt, estimated at ~4 characters per token
+MAX_CONTEXT_TOKENS = 2500
+CHARS_PER_TOKEN = 4
+# Chunks containing SQL commands are moved to the front of the context
+SQL_CHUNK_KEYWORDS = ("create user", "grant", "identified by", "tablespace", "alter user", "sql*plus")
+_SQL_CHUNK_RE = re.compile('|'.join(map(re.escape, SQL_CHUNK_KEYWORDS)), re.IGNORECASE)
+
+# Answer post-processing patterns, each group compiled into one pattern.
+# Prompt echoes mirror the prompt text built in _stream_response; keep them in sync
+INSTRUCTION_ECHO_PATTERNS = (
+    "You are a documentation assistant",
+    "Answer the question using the sources",
+    "SOURCES:",
+    "### Source ",
+    "INSTRUCTIONS:",
+    "Give a clear, complete answer",
+    "Put SQL commands in code blocks",
+    "List steps in order",
+    "Combine information from multiple sources",
+    "Do NOT repeat",
+    "Start your answer",
+    "start your answer directly",
+    "USER QUESTION:"
+)
+END_PATTERNS = (
+    "<<variable>> The source does not provide",
+    "<<variable>>",
+    "The source does not provide",
+    "I will not include",
+    "Do NOT repeat",
+    "SOURCES:",
+    "### Source ",
+    "INSTRUCTIONS:",
+    "Put SQL commands in code blocks",
+    "List steps in order",
+    "Combine information from multiple sources",
+    "USER QUESTION:",
+    "\n\nIf you are running Oracle E-Business Suite Release 12.2",
+    "\nTo create the workspace",
+    "\nEnable Edition-Based Redefinition",
+    "\nCreate a workspace",
+    "\nAlter the APEX schema",
+    "\nRun the application",
+    "\nClick Using Responsibilities"
+)
+FRAGMENT_WORDS = ('format', 'command', 'instruction', 'source', 'answer')
+TRAILING_FRAGMENT_WORDS = FRAGMENT_WORDS + ('provide', 'include')
+SQL_LINE_KEYWORDS = (
+    "create user", "identified by", "default tablespace",
+    "grant", "alter user", "connect to", "sql*plus"
+)
+SQL_ANSWER_KEYWORDS = ("create user", "grant", "identified by")
+_INSTRUCTION_ECHO_RE = re.compile('|'.join(map(re.escape, INSTRUCTION_ECHO_PATTERNS)))
+_END_RE = re.compile('|'.join(map(re.escape, END_PATTERNS)))
+# End patterns that cut the answer short ('<<variable>>' may be a SQL placeholder).
+# A zero-width lookahead also reports overlapping hits; the group number names the pattern
+END_CUT_PATTERNS = tuple(p for p in END_PATTERNS if "<<variable>>" not in p)
+_END_CUT_RE = re.compile('(?=' + '|'.join(f'({re.escape(p)})' for p in END_CUT_PATTERNS) + ')')
+# Case-insensitive matching replaces a lowercased copy of every line
+_FRAGMENT_WORDS_RE = re.compile('|'.join(FRAGMENT_WORDS), re.IGNORECASE)
+_TRAILING_FRAGMENT_WORDS_RE = re.compile('|'.join(TRAILING_FRAGMENT_WORDS), re.IGNORECASE)
+_SQL_LINE_RE = re.compile('|'.join(map(re.escape, SQL_LINE_KEYWORDS)), re.IGNORECASE)
+_SQL_ANSWER_RE = re.compile('|'.join(map(re.escape, SQL_ANSWER_KEYWORDS)), re.IGNORECASE)
+
+@functools.lru_cache(maxsize=1024)
+def classify_question(question):
     """
-    Generate AI response using Ollama with RAG context
+    Classify a question by the context it needs (memoized per question)
     
     Args:
         question: User's question
-        context_chunks: List of relevant document chunks (should be sorted by relevance)
-        max_tokens: Maximum tokens in response
     
     Returns:
-        AI-generated response string
+        tuple: (is_complete_steps_question, is_sql_question)
     """
-    try:
-        # Sort chunks by similarity score (distance) - lower is better
-        sorted_chunks = sorted(context_chunks, key=lambda x: x.get('distance', 1.0))
-        
-        # Detect if this is a "complete steps" question - need more context
-        is_complete_steps_question = any(phrase in question.lower() for phrase in [
-            "complete steps", "all steps", "full steps", "entire process", 
-            "complete process", "all the steps", "step by step"
-        ])
-        
-        # Detect if question asks for SQL/database commands
-        is_sql_question = any(keyword in question.lower() for keyword in [
-            "sql", "create user", "grant", "database user", "schema", 
-            "privileges", "minimally privileged", "sql commands"
-        ])
-        
-        # Use more chunks for complete steps or SQL questions
-        if is_complete_steps_question or is_sql_question:
-            # Use top 7 chunks for complete steps questions
-            top_chunks = sorted_chunks[:7]
-            # Prioritize chunks with SQL keywords
-            sql_keywords = ["create user", "grant", "identified by", "tablespace", "alter user", "sql*plus"]
-            chunks_with_sql = [c for c in top_chunks if any(kw in c.get('chunk_text', '').lower() for kw in sql_keywords)]
-            other_chunks = [c for c in top_chunks if c not in chunks_with_sql]
-            # Reorder: SQL chunks first, then others
-            top_chunks = chunks_with_sql + other_chunks
-        else:
-            # Use top 3 for regular questions
-            top_chunks = sorted_chunks[:3]
-        
-        # Prepare context - include multiple chunks for complete steps
-        context_text = ""
-        
-        if is_complete_steps_question or is_sql_question:
-            # For complete steps, include all relevant chunks
-            for i, chunk in enumerate(top_chunks, 1):
-                chunk_text = chunk.get('chunk_text', '')
-                page_num = chunk.get('page_number', 0)
-                doc_name = chunk.get('doc_name', 'Unknown')
-                
-                if i == 1:
-                    context_text += f"\n=== PRIMARY SOURCE - MOST RELEVANT (Page {page_num}, {doc_name}) ===\n"
-                else:
-                    context_text += f"\n=== ADDITIONAL SOURCE {i} (Page {page_num}, {doc_name}) ===\n"
-                context_text += f"{chunk_text}\n"
-                context_text += f"=== END SOURCE {i} ===\n"
-        else:
-            # For regular questions, use only primary source
-            if top_chunks:
-                first_chunk = top_chunks[0]
-                full_chunk_text = first_chunk.get('chunk_text', '')
-                context_text += f"\n=== PRIMARY SOURCE - MOST RELEVANT (Page {first_chunk.get('page_number', 0)}) ===\n"
-                context_text += f"{full_chunk_text}\n"
-                context_text += "=== END PRIMARY SOURCE ===\n"
-        
-        # Adjust system prompt based on question type
-        if is_complete_steps_question or is_sql_question:
-            system_prompt = f"""You are a helpful documentation assistant. Answer the user's question using the source information provided below.
+    question_lower = question.lower()
+    
+    # Detect if this is a "complete steps" question - need more context
+    is_complete_steps_question = _COMPLETE_STEPS_RE.search(question_lower) is not None
+    
+    # Detect if question asks for SQL/database commands
+    is_sql_question = _SQL_QUESTION_RE.search(question_lower) is not None
+    
+    return is_complete_steps_question, is_sql_question
 
-SOURCE INFORMATION:
-{context_text}
+@st.cache_resource
+def get_ollama_session():
+    """Get a shared HTTP session for Ollama (keeps connections alive across reruns)"""
+    session = requests.Session()
+    # Enough pooled connections for every chat session streaming at once
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(OLLAMA_NUM_PARALLEL, 1))
+    session.mount('http://', adapter)
+    return session
 
-INSTRUCTIONS:
-- Use the source information above to provide a complete answer
-- If the source contains SQL commands, include them in code blocks (```sql ... ```)
-- If the source contains steps, list them in order
-- Combine information from multiple sources if needed
-- Do NOT repeat these instructions in your answer
-- Start your answer directly without preamble"""
-        else:
-            # Regular question prompt
-            system_prompt = f"""You are a helpful documentation assistant. Answer the user's question using the source information provided below.
+def _stream_response(question, context_chunks, max_tokens):
+    """Build the RAG prompt and yield response fragments from Ollama (raises on failure)"""
+    # Sort chunks by similarity score (distance) - lower is better
+    sorted_chunks = sorted(context_chunks, key=lambda x: x.get('distance', 1.0))
+    
+    is_complete_steps_question, is_sql_question = classify_question(question)
+    
+    # Use more chunks for complete steps or SQL questions
+    if is_complete_steps_question or is_sql_question:
+        # Use top 7 chunks for complete steps questions
+        top_chunks = sorted_chunks[:7]
+        # Prioritize chunks with SQL keywords (one case-insensitive pass per chunk, no lowercased copy)
+        chunks_with_sql = [c for c in top_chunks if _SQL_CHUNK_RE.search(c.get('chunk_text', ''))]
+        # Partition by identity: a set lookup instead of comparing whole dicts
+        sql_chunk_ids = {id(c) for c in chunks_with_sql}
+        other_chunks = [c for c in top_chunks if id(c) not in sql_chunk_ids]
+        # Reorder: SQL chunks first, then others
+        top_chunks = chunks_with_sql + other_chunks
+    else:
+        # Use top 3 for regular questions
+        top_chunks = sorted_chunks[:3]
+    
+    # Prepare context - include multiple chunks for complete steps, only the
+    # primary source otherwise. Every prompt token is prefill work for the model,
+    # so headers are short and the context stops at the token budget
+    # (the most relevant chunk is always included in full)
+    multi_source = is_complete_steps_question or is_sql_question
+    context_parts = []
+    context_chars = 0
+    for i, chunk in enumerate(top_chunks if multi_source else top_chunks[:1], 1):
+        chunk_text = chunk.get('chunk_text', '')
+        if context_parts and context_chars + len(chunk_text) > MAX_CONTEXT_TOKENS * CHARS_PER_TOKEN:
+            break
+        context_chars += len(chunk_text)
+        context_parts.append(f"### Source {i} (Page {chunk.get('page_number', 0)}, {chunk.get('doc_name', 'Unknown')})\n{chunk_text}")
+    context_text = "\n\n".join(context_parts)
+    
+    # Adjust instructions based on question type
+    combine_hint = "\n- Combine information from multiple sources if needed" if multi_source else ""
+    system_prompt = f"""You are a documentation assistant. Answer the question using the sources below.
 
-SOURCE INFORMATION:
+SOURCES:
 {context_text}
 
 INSTRUCTIONS:
-- Use the source information above to answer the question completely
-- If the source contains SQL commands, include them in code blocks (```sql ... ```)
-- If the source contains steps, list them in order
-- Provide a clear, complete answer
-- Do NOT repeat these instructions in your answer
-- Start your answer directly without preamble"""
+- Give a clear, complete answer
+- Put SQL commands in code blocks (```sql ... ```)
+- List steps in order{combine_hint}
+- Do NOT repeat these instructions; start your answer directly"""
 
-        # Create the full prompt - cleaner and more direct
-        full_prompt = f"""{system_prompt}
+    full_prompt = f"""{system_prompt}
 
 USER QUESTION: {question}
 
-Provide a clear, complete answer based on the source(s) above. Do NOT repeat these instructions. Start your answer directly:"""
+ANSWER:"""
 
-        # Call Ollama API with strict settings
-        payload = {
-            "model": OLLAMA_MODEL,
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {
-                "num_predict": max_tokens,
-                "temperature": 0.0,
-                "top_p": 0.9,
-                "repeat_penalty": 1.2,
-                "stop": [
-                    "\n\nIf you are running",
-                    "\nTo create the workspace",
-                    "\nEnable Edition-Based Redefinition",
-                    "\nCreate a workspace",
-                    "\nAlter the APEX schema",
-                    "\nRun the application",
-                    "\n<<variable>>",
-                    "\nThe source does not provide",
-                    "Do NOT repeat",
-                    "CRITICAL INSTRUCTIONS",
-                    "Answer format"
-                ]
-            }
+    # Call Ollama API with strict settings
+    payload = {
+        "model": OLLAMA_MODEL,
+        "prompt": full_prompt,
+        "stream": True,
+        "options": {
+            "num_predict": max_tokens,
+            "temperature": 0.0,
+            "top_p": 0.9,
+            "repeat_penalty": 1.2,
+            "stop": [
+                "\n\nIf you are running",
+                "\nTo create the workspace",
+                "\nEnable Edition-Based Redefinition",
+                "\nCreate a workspace",
+                "\nAlter the APEX schema",
+                "\nRun the application",
+                "\n<<variable>>",
+                "\nThe source does not provide",
+                "Do NOT repeat",
+                "\nSOURCES:",
+                "\n### Source ",
+                "\nINSTRUCTIONS:",
+                "\nUSER QUESTION:"
+            ]
         }
+    }
+    
+    with get_ollama_session().post(OLLAMA_URL, json=payload, stream=True, timeout=120) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"Ollama API error: {response.status_code} - {response.text}")
         
-        response = requests.post(OLLAMA_URL, json=payload, timeout=120)
+        # Ollama sends one JSON object per line until 'done'
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get('response'):
+                yield chunk['response']
+            if chunk.get('done'):
+                break
+
+def _error_message(error):
+    """User-facing description of a failed Ollama request"""
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return "Cannot connect to Ollama. Make sure Ollama is running (ollama serve)"
+    return f"Error generating response: {error}"
+
+def generate_rag_response_stream(question, context_chunks, max_tokens=1500):
+    """
+    Stream an AI response from Ollama with RAG context, token by token
+    
+    Yields raw model output as it is decoded (e.g. for st.write_stream), so
+    the first words show up without waiting for the whole answer. Pass the
+    joined text through clean_answer once the stream ends.
+    
+    Args:
+        question: User's question
+        context_chunks: List of relevant document chunks (should be sorted by relevance)
+        max_tokens: Maximum tokens in response
+    
+    Yields:
+        Response text fragments
+    
+    Raises:
+        RuntimeError: With a user-facing message if the request fails, including
+        part-way through the stream, so a truncated answer is never mistaken
+        for a complete one
+    """
+    try:
+        yield from _stream_response(question, context_chunks, max_tokens)
+    except Exception as e:
+        raise RuntimeError(_error_message(e)) from e
+
+def clean_answer(answer):
+    """
+    Post-process a complete model answer
+    
+    Strips echoed prompt instructions and trailing boilerplate, and wraps
+    SQL commands in code blocks.
+    
+    Args:
+        answer: Raw response text
+    
+    Returns:
+        Cleaned response string
+    """
+    answer = answer.strip()
+    if not answer:
+        return answer
+    
+    # Remove instruction echoes at the start: everything before the first line
+    # that is neither blank, an echoed instruction, nor an instruction fragment
+    lines = answer.split('\n')
+    content_start = len(lines)
+    for i, line in enumerate(lines):
+        line_stripped = line.strip()
+        # Check if this line is an instruction echo
+        is_instruction = _INSTRUCTION_ECHO_RE.search(line_stripped) is not None
         
-        if response.status_code == 200:
-            result = response.json()
-            answer = result.get('response', 'No response generated').strip()
-            
-            # Post-process: Clean up the response
-            if answer:
-                # Remove instruction echoes at the start
-                instruction_patterns_start = [
-                    "Use a code block",
-                    "Keep SQL statements",
-                    "Don't break SQL",
-                    "Include all commands",
-                    "Include ALL commands",
-                    "Answer format for",
-                    "CRITICAL INSTRUCTIONS:",
-                    "PRIMARY SOURCE:",
-                    "ADDITIONAL SOURCE",
-                    "Do NOT repeat",
-                    "Start your answer",
-                    "Provide a clear, complete answer"
-                ]
-                
-                lines = answer.split('\n')
-                cleaned_lines = []
-                skip_until_content = True
-                found_real_content = False
-                
-                for line in lines:
-                    line_stripped = line.strip()
-                    # Check if this line is an instruction echo
-                    is_instruction = any(pattern in line_stripped for pattern in instruction_patterns_start)
-                    
-                    # Also check if line is too short and looks like an instruction fragment
-                    is_fragment = (len(line_stripped) < 50 and 
-                                  any(word in line_stripped.lower() for word in ['format', 'command', 'instruction', 'source', 'answer']))
-                    
-                    if (is_instruction or is_fragment) and skip_until_content:
-                        continue  # Skip instruction echoes
-                    else:
-                        # Found real content
-                        if line_stripped and not is_instruction:
-                            found_real_content = True
-                            skip_until_content = False
-                        if found_real_content or not skip_until_content:
-                            cleaned_lines.append(line)
-                
-                answer = '\n'.join(cleaned_lines).strip()
-                
-                # Remove unwanted content at the end
-                end_patterns = [
-                    "<<variable>> The source does not provide",
-                    "<<variable>>",
-                    "The source does not provide",
-                    "I will not include",
-                    "Do NOT repeat",
-                    "CRITICAL INSTRUCTIONS",
-                    "Answer format",
-                    "PRIMARY SOURCE",
-                    "ADDITIONAL SOURCE",
-                    "INSTRUCTIONS:",
-                    "\n\nIf you are running Oracle E-Business Suite Release 12.2",
-                    "\nTo create the workspace",
-                    "\nEnable Edition-Based Redefinition",
-                    "\nCreate a workspace",
-                    "\nAlter the APEX schema",
-                    "\nRun the application",
-                    "\nClick Using Responsibilities"
-                ]
-                
-                # Remove content after end patterns (but preserve <<variable>> if it's in SQL code blocks)
-                # First, check if <<variable>> is in a code block (should be kept)
-                in_code_block = False
-                for pattern in end_patterns:
-                    if pattern in answer and "<<variable>>" not in pattern:
-                        # Find the last occurrence and remove everything after it
-                        idx = answer.rfind(pattern)
-                        if idx > len(answer) * 0.5:  # Only if it's in the latter half
-                            answer = answer[:idx].strip()
-                            break
-                
-                # Remove trailing instruction-like text line by line
-                answer_lines = answer.split('\n')
-                while answer_lines:
-                    last_line = answer_lines[-1].strip()
-                    # Check if last line matches end patterns
-                    matches_end_pattern = any(pattern in last_line for pattern in end_patterns)
-                    # Also check if it's a short line that looks like an instruction fragment
-                    is_short_instruction = (len(last_line) < 60 and 
-                                          any(word in last_line.lower() for word in ['format', 'command', 'instruction', 'source', 'answer', 'provide', 'include']))
-                    
-                    if matches_end_pattern or is_short_instruction:
-                        answer_lines.pop()
-                    else:
-                        break
-                answer = '\n'.join(answer_lines).strip()
-                
-                # Fix SQL formatting - ensure SQL commands are in code blocks
-                if "create user" in answer.lower() or "grant" in answer.lower() or "identified by" in answer.lower():
-                    lines = answer.split('\n')
-                    formatted_lines = []
-                    in_sql_block = False
-                    sql_keywords = [
-                        "create user", "identified by", "default tablespace", 
-                        "grant", "alter user", "connect to", "sql*plus"
-                    ]
-                    
-                    for line in lines:
-                        line_lower = line.lower().strip()
-                        # Detect SQL lines
-                        if any(sql_keyword in line_lower for sql_keyword in sql_keywords):
-                            if not in_sql_block:
-                                formatted_lines.append("")
-                                in_sql_block = True
-                            # Remove numbered prefixes like "3)", "4)", etc.
-                            cleaned_line = line
-                            if line.strip() and line.strip()[0].isdigit() and ')' in line[:3]:
-                                # Remove number and parenthesis at start
-                                cleaned_line = line.split(')', 1)[-1].strip()
-                            formatted_lines.append(cleaned_line)
-                        elif in_sql_block:
-                            # Check if this line ends the SQL block
-                            if line.strip() and not any(sql_keyword in line.lower() for sql_keyword in sql_keywords):
-                                # End SQL block if we hit a non-SQL line
-                                if line.strip() and not line.strip().startswith(')'):
-                                    formatted_lines.append("```")
-                                    in_sql_block = False
-                                    formatted_lines.append(line)
-                                else:
-                                    # Empty line or just closing paren - keep in SQL block
-                                    formatted_lines.append(line)
-                            else:
-                                formatted_lines.append(line)
-                        else:
-                            formatted_lines.append(line)
-                    
-                    if in_sql_block:
-                        formatted_lines.append("```")
-                    
-                    answer = '\n'.join(formatted_lines)
-            
-            return answer
+        # Also check if line is too short and looks like an instruction fragment
+        is_fragment = (len(line_stripped) < 50 and 
+                      _FRAGMENT_WORDS_RE.search(line_stripped) is not None)
+        
+        if line_stripped and not (is_instruction or is_fragment):
+            content_start = i
+            break
+    
+    answer = '\n'.join(lines[content_start:]).strip()
+    
+    # Remove content after end patterns (but preserve <<variable>> if it's in SQL code blocks).
+    # One sweep over the latter half records the last hit of each pattern; the
+    # earliest-listed pattern found there wins and the answer is cut at its last hit
+    last_hits = {}
+    for match in _END_CUT_RE.finditer(answer, len(answer) // 2 + 1):
+        last_hits[match.lastindex] = match.start()
+    if last_hits:
+        answer = answer[:last_hits[min(last_hits)]].strip()
+    
+    # Remove trailing instruction-like text line by line, walking back from the
+    # end of the string so only the trailing lines are examined
+    end = len(answer)
+    while end:
+        line_start = answer.rfind('\n', 0, end) + 1
+        last_line = answer[line_start:end].strip()
+        # Check if last line matches end patterns
+        matches_end_pattern = _END_RE.search(last_line) is not None
+        # Also check if it's a short line that looks like an instruction fragment
+        is_short_instruction = (len(last_line) < 60 and 
+                              _TRAILING_FRAGMENT_WORDS_RE.search(last_line) is not None)
+        
+        if matches_end_pattern or is_short_instruction:
+            end = max(line_start - 1, 0)
         else:
-            st.error(f"Ollama API error: {response.status_code} - {response.text}")
-            return None
-            
-    except requests.exceptions.ConnectionError:
-        st.error("Cannot connect to Ollama. Make sure Ollama is running (ollama serve)")
-        return None
+            break
+    answer = answer[:end].strip()
+    
+    # Fix SQL formatting - ensure SQL commands are in code blocks
+    if _SQL_ANSWER_RE.search(answer):
+        lines = answer.split('\n')
+        formatted_lines = []
+        in_sql_block = False
+        
+        for line in lines:
+            # Detect SQL lines
+            if _SQL_LINE_RE.search(line):
+                if not in_sql_block:
+                    formatted_lines.append("")
+                    in_sql_block = True
+                # Remove numbered prefixes like "3)", "4)", etc.
+                cleaned_line = line
+                if line.strip() and line.strip()[0].isdigit() and ')' in line[:3]:
+                    # Remove number and parenthesis at start
+                    cleaned_line = line.split(')', 1)[-1].strip()
+                formatted_lines.append(cleaned_line)
+            elif in_sql_block:
+                # Check if this line ends the SQL block
+                if line.strip() and not _SQL_LINE_RE.search(line):
+                    # End SQL block if we hit a non-SQL line
+                    if line.strip() and not line.strip().startswith(')'):
+                        formatted_lines.append("```")
+                        in_sql_block = False
+                        formatted_lines.append(line)
+                    else:
+                        # Empty line or just closing paren - keep in SQL block
+                        formatted_lines.append(line)
+                else:
+                    formatted_lines.append(line)
+            else:
+                formatted_lines.append(line)
+        
+        if in_sql_block:
+            formatted_lines.append("```")
+        
+        answer = '\n'.join(formatted_lines)
+    
+    return answer
+
+def generate_rag_response(question, context_chunks, max_tokens=1500):
+    """
+    Generate AI response using Ollama with RAG context
+    
+    Args:
+        question: User's question
+        context_chunks: List of relevant document chunks (should be sorted by relevance)
+        max_tokens: Maximum tokens in response
+    
+    Returns:
+        AI-generated response string, or None on error
+    """
+    try:
+        answer = ''.join(_stream_response(question, context_chunks, max_tokens))
     except Exception as e:
-        st.error(f"Error generating response: {e}")
+        st.error(_error_message(e))
         return None
+    
+    return clean_answer(answer) if answer.strip() else None
 
 def test_ollama_connection():
     """Test if Ollama is running and accessible"""
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        response = get_ollama_session().get("http://localhost:11434/api/tags", timeout=5)
         return response.status_code == 200
     except:
         return False
\ No newline at end of file
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Ingestion Pipeline Module
+Runs extract, chunk, embed, and store as overlapping stages across documents
+"""
+
+import itertools
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from modules.document_processor import iter_chunks
+from modules.embeddings_local import embed_texts, load_embedding_model, get_embedding_cache
+from modules.database_local import add_document_chunks, remove_upload, get_or_create_collection
+from modules.query_cache import get_search_cache
+
+# Pipeline configuration
+EMBED_BATCH_SIZE = 64
+STAGE_QUEUE_SIZE = 4  # Bounded queues give backpressure between stages
+PROGRESS_INTERVAL = 0.5  # Minimum seconds between embed_progress events per document
+
+# Marks the end of work for a stage
+_DONE = object()
+
+def _read_pages(page_queue, end):
+    """
+    Yield the pages an extract thread puts on page_queue
+    
+    Stops at the stage's end marker and re-raises an extraction error in
+    the consuming thread; either way the marker is recorded in end.
+    """
+    while True:
+        page = page_queue.get()
+        if page is _DONE or isinstance(page, Exception):
+            end.append(page)
+            if page is not _DONE:
+                raise page
+            return
+        yield page
+
+def run_ingestion_pipeline(items, load_fn, on_event=None, chunk_workers=None, extract_workers=None):
+    """
+    Ingest documents through pipelined extract -> chunk -> embed -> store stages
+    
+    Extract threads open each document and pull its pages (the actual text
+    extraction) onto a per-document queue of at most STAGE_QUEUE_SIZE pages.
+    The chunk thread reads those queues one document at a time, so while it
+    chunks document N, later documents are already being extracted up to that
+    bound; chunks then flow to the embed and store threads in batches. Every
+    hand-off is a bounded queue, so memory stays bounded for large documents.
+    Worker threads only produce events and never touch the UI (they have no
+    script run context): stage failures are raised by the helpers and
+    reported through the item's result event. The shared model, database and
+    caches are opened up front, so workers only reuse st.cache_resource
+    values. on_event is always called on the calling (Streamlit script) thread.
+    
+    Args:
+        items: List of dicts with keys: name (display name), source (passed to load_fn)
+        load_fn: Callable(source) -> (pages, doc_name, error_message), where pages
+            is any iterable (e.g. a generator) of dicts with keys: page_number, text
+        on_event: Optional callable(event_dict) for progress and results
+        chunk_workers: Threads used to chunk the pages of a document in parallel
+        extract_workers: Items loaded concurrently (defaults to min(items, CPU count))
+    
+    Returns:
+        list: One result dict per item with keys: index, name, status, message/chunks
+    """
+    if not extract_workers:
+        extract_workers = min(len(items), os.cpu_count() or 4)
+    
+    # Open shared resources on this (script) thread; a failure here is shown
+    # once and then reported again by the stage that needs the resource
+    load_embedding_model()
+    get_embedding_cache()
+    get_or_create_collection()
+    get_search_cache()
+    
+    events = queue.Queue()
+    chunk_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+    embed_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+    store_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+    
+    def emit(event_type, index, **fields):
+        events.put({'type': event_type, 'index': index, 'name': items[index]['name'], **fields})
+    
+    def fail(index, message, details=None):
+        emit('result', index, status='failed', message=message, details=details)
+    
+    def extract(index):
+        try:
+            emit('extracting', index)
+            pages, doc_name, error = load_fn(items[index]['source'])
+            if error:
+                fail(index, error)
+                return
+        except Exception as e:
+            fail(index, f"Error - {e}", traceback.format_exc())
+            return
+        
+        # Pages are extracted here; the chunk thread picks them up in order
+        page_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+        chunk_queue.put((index, doc_name, page_queue))
+        try:
+            for page in pages:
+                page_queue.put(page)
+            page_queue.put(_DONE)
+        except Exception as e:
+            # Raised again by the chunk thread, which reports it with the document
+            page_queue.put(e)
+    
+    def chunk_worker():
+        # Pages are read from the extract stage one window per round of chunking
+        # threads, and chunks leave in embedding-sized batches, so a whole
+        # document is never held
+        window_size = chunk_workers or os.cpu_count() or 4
+        # One pool serves every window of every document
+        executor = ThreadPoolExecutor(max_workers=window_size)
+        while (job := chunk_queue.get()) is not _DONE:
+            index, doc_name, page_queue = job
+            end = []
+            try:
+                emit('chunking', index)
+                page_count = itertools.count()
+                counted_pages = (page for page, _ in zip(_read_pages(page_queue, end), page_count))
+                chunks = iter_chunks(counted_pages, window_size=window_size, executor=executor)
+                chunk_count = 0
+                
+                while batch := list(itertools.islice(chunks, EMBED_BATCH_SIZE)):
+                    chunk_count += len(batch)
+                    embed_queue.put(('chunks', index, doc_name, batch))
+                
+                # zip stops before advancing the counter past the last page
+                emit('extracted', index, pages=next(page_count))
+                if not chunk_count:
+                    embed_queue.put(('abort', index, doc_name, ("No chunks created. Content may be too short.", None)))
+                    continue
+                
+                emit('chunked', index, chunks=chunk_count)
+                embed_queue.put(('end', index, doc_name, chunk_count))
+            except Exception as e:
+                embed_queue.put(('abort', index, doc_name, (f"Error - {e}", traceback.format_exc())))
+                # Drain the rest of the document so its extract thread never blocks
+                try:
+                    for _ in (_read_pages(page_queue, end) if not end else ()):
+                        pass
+                except Exception:
+                    pass  # Already failed; a later extraction error changes nothing
+        executor.shutdown()
+        embed_queue.put(_DONE)
+    
+    def embed_worker():
+        failed = set()
+        embedded = {}
+        last_progress = {}
+        while (job := embed_queue.get()) is not _DONE:
+            kind, index, doc_name, payload = job
+            if kind != 'chunks':
+                # Failures were already forwarded as an abort
+                if index not in failed:
+                    store_queue.put(job)
+                continue
+            if index in failed:
+                continue
+            
+            try:
+                if index not in embedded:
+                    embedded[index] = 0
+                    emit('embedding', index)
+                embeddings = embed_texts(
+                    [chunk['chunk_text'] for chunk in payload],
+                    batch_size=EMBED_BATCH_SIZE
+                )
+                
+                embedded[index] += len(payload)
+                # Each progress event becomes a widget update, so rate-limit them
+                now = time.monotonic()
+                if now - last_progress.get(index, 0.0) >= PROGRESS_INTERVAL:
+                    last_progress[index] = now
+                    emit('embed_progress', index, done=embedded[index])
+                
+                # Chunk metadata and the (N, dim) embedding matrix travel side by side
+                store_queue.put(('chunks', index, doc_name, (payload, embeddings)))
+            except Exception as e:
+                failed.add(index)
+                store_queue.put(('abort', index, doc_name, (f"Failed to generate embeddings - {e}", traceback.format_exc())))
+        store_queue.put(_DONE)
+    
+    def store_worker():
+        failed = set()
+        upload_ids = {}
+        
+        def abort(index, message, details=None):
+            # Roll back the batches already stored for this document
+            failed.add(index)
+            if index in upload_ids:
+                try:
+                    remove_upload(upload_ids[index])
+                except Exception as e:
+                    message += f" (rollback failed: {e})"
+            fail(index, message, details)
+        
+        while (job := store_queue.get()) is not _DONE:
+            kind, index, doc_name, payload = job
+            if index in failed:
+                continue
+            
+            try:
+                if kind == 'chunks':
+                    if index not in upload_ids:
+                        upload_ids[index] = str(uuid.uuid4())[:8]
+                        emit('storing', index)
+                    chunks, embeddings = payload
+                    add_document_chunks(doc_name, chunks, embeddings, upload_id=upload_ids[index])
+                elif kind == 'end':
+                    emit('result', index, status='success', chunks=payload)
+                else:
+                    abort(index, *payload)
+            except Exception as e:
+                abort(index, f"Failed to store in database - {e}", traceback.format_exc())
+    
+    def extract_all():
+        with ThreadPoolExecutor(max_workers=max(1, extract_workers)) as executor:
+            list(executor.map(extract, range(len(items))))
+        chunk_queue.put(_DONE)
+    
+    workers = [threading.Thread(target=target, daemon=True)
+               for target in (extract_all, chunk_worker, embed_worker, store_worker)]
+    for worker in workers:
+        worker.start()
+    
+    # Drain events on this thread until every item has a result
+    results = []
+    while len(results) < len(items):
+        event = events.get()
+        if event['type'] == 'result':
+            results.append(event)
+        if on_event:
+            on_event(event)
+    
+    for worker in workers:
+        worker.join()
+    
+    return sorted(results, key=lambda r: r['index'])
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Semantic Query Cache Module
+Reuses answers for near-duplicate questions by comparing query embeddings
+"""
+
+import numpy as np
+import streamlit as st
+import atexit
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+CACHE_SIMILARITY_THRESHOLD = 0.95  # Cosine similarity required for a hit
+CACHE_MAX_ENTRIES = 256
+CACHE_FILE_NAME = "query_cache.pkl"
+SAVE_INTERVAL = 30  # Minimum seconds between writes of a persisted cache
+
+# Retrieval results are reused only for near-identical query vectors
+SEARCH_CACHE_SIMILARITY_THRESHOLD = 0.97
+SEARCH_CACHE_MAX_ENTRIES = 64
+
+class SemanticCache:
+    """Nearest-neighbour cache of (query embedding, payload) pairs, optionally persisted to disk"""
+    
+    def __init__(self, path=None, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.embeddings = None  # float32 (N, dim), rows L2-normalized
+        self.payloads = []
+        self.params = []  # Entries only match lookups made with equal params
+        self.recency = OrderedDict()  # Entry index -> None, least recently used first
+        # Writes are debounced; whatever is still unsaved is flushed at exit
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._load()
+        if self.path:
+            atexit.register(self.flush)
+    
+    def lookup(self, query_embedding, threshold=CACHE_SIMILARITY_THRESHOLD, params=None):
+        """
+        Find a cached payload for a similar query
+        
+        Args:
+            query_embedding: Embedding vector of the query
+            threshold: Minimum cosine similarity to count as a hit
+            params: Hashable extra key; only entries added with equal params match
+        
+        Returns:
+            Cached payload, or None on a miss
+        """
+        query = _normalize(query_embedding)
+        with self.lock:
+            candidates = [i for i, entry_params in enumerate(self.params) if entry_params == params]
+            if not candidates:
+                return None
+            
+            # Rows are normalized, so the dot product is the cosine similarity
+            similarities = self.embeddings[candidates] @ query
+            best_candidate = int(np.argmax(similarities))
+            best = candidates[best_candidate]
+            if similarities[best_candidate] < threshold:
+                return None
+            
+            self.recency.move_to_end(best)
+            self._dirty = True
+            return self.payloads[best]
+    
+    def add(self, query_embedding, payload, params=None):
+        """Store a payload for a query (and params), evicting the least recently used entry when full"""
+        query = _normalize(query_embedding)
+        with self.lock:
+            if len(self.payloads) >= self.max_entries:
+                # Reuse the evicted entry's row in place
+                slot, _ = self.recency.popitem(last=False)
+                self.embeddings[slot] = query
+                self.payloads[slot] = payload
+                self.params[slot] = params
+            else:
+                slot = len(self.payloads)
+                if self.embeddings is None or not self.payloads:
+                    self.embeddings = query.reshape(1, -1)
+                else:
+                    self.embeddings = np.vstack([self.embeddings, query])
+                self.payloads.append(payload)
+                self.params.append(params)
+            self.recency[slot] = None
+            self._dirty = True
+            save_due = time.monotonic() - self._last_save >= SAVE_INTERVAL
+        if save_due:
+            self.flush()
+    
+    def clear(self):
+        """Drop all cached entries (call when the knowledge base changes)"""
+        with self.lock:
+            self.embeddings = None
+            self.payloads = []
+            self.params = []
+            self.recency = OrderedDict()
+            self._dirty = True
+        # Stale answers must not come back after a restart, so write right away
+        self.flush()
+    
+    def _load(self):
+        """Load cached entries from disk if present"""
+        try:
+            if self.path and os.path.exists(self.path):
+                with open(self.path, 'rb') as f:
+                    data = pickle.load(f)
+                self.embeddings = data['embeddings']
+                self.payloads = data['payloads']
+                # Files written before params existed hold only unparameterized entries
+                self.params = data.get('params', [None] * len(self.payloads))
+                if 'recency' in data:
+                    order = data['recency']
+                else:
+                    # Older files kept hit counts; treat the least-hit entries as least recent
+                    hit_counts = data['hit_counts']
+                    order = sorted(range(len(hit_counts)), key=lambda i: hit_counts[i])
+                self.recency = OrderedDict.fromkeys(order)
+        except Exception as e:
+            logger.warning("Could not load query cache, starting empty: %s", e)
+            self.embeddings = None
+            self.payloads = []
+            self.params = []
+            self.recency = OrderedDict()
+    
+    def flush(self):
+        """Write unsaved entries to disk (in-memory caches have no path)"""
+        if not self.path:
+            return
+        # Writers take turns so an older snapshot never overwrites a newer one
+        with self._save_lock:
+            # Snapshot under the lock, then pickle without blocking lookups
+            with self.lock:
+                if not self._dirty:
+                    return
+                snapshot = {
+                    'embeddings': None if self.embeddings is None else self.embeddings.copy(),
+                    'payloads': list(self.payloads),
+                    'params': list(self.params),
+                    'recency': list(self.recency)
+                }
+                self._dirty = False
+                self._last_save = time.monotonic()
+            
+            try:
+                with open(self.path, 'wb') as f:
+                    pickle.dump(snapshot, f)
+            except Exception as e:
+                logger.warning("Could not save query cache: %s", e)
+                with self.lock:
+                    self._dirty = True
+
+def _normalize(embedding):
+    """Return embedding as an L2-normalized float32 vector"""
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+@st.cache_resource
+def get_query_cache():
+    """Get the shared semantic query cache (cached for performance)"""
+    cache_dir = os.path.join(os.getcwd(), "data")
+    os.makedirs(cache_dir, exist_ok=True)
+    return SemanticCache(os.path.join(cache_dir, CACHE_FILE_NAME))
+
+@st.cache_resource(show_spinner=False)
+def get_search_cache():
+    """Get the shared in-memory cache of vector search results (cached for performance)"""
+    return SemanticCache(max_entries=SEARCH_CACHE_MAX_ENTRIES)